@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+
+# --- Settings ---
+
+MAX_ENTRIES = int(os.environ.get("RATEBUILDER_CACHE_ENTRIES", "8"))
+TTL_SECONDS = int(os.environ.get("RATEBUILDER_CACHE_TTL", "3600"))
+
+# Bytes digested from the head, middle and tail of an upload
+SAMPLE_BYTES = 1 << 20
+
+# --- Fingerprints ---
+
+def upload_fingerprint(file):
+    """Identifies an upload by name, size, file id and a digest of its head, middle and tail.
+
+    The digest reads at most 3 * SAMPLE_BYTES straight from the upload's
+    buffer, without copying it, whatever the size of the file.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with file.getbuffer() as view:
+        size = len(view)
+        for start in sorted({0, max(0, (size - SAMPLE_BYTES) // 2), max(0, size - SAMPLE_BYTES)}):
+            digest.update(view[start:start + SAMPLE_BYTES])
+    return file.name, size, getattr(file, "file_id", None), digest.hexdigest()
+
+# --- Caching ---
+
+def cache_deck_build(func):
+    """Caches a deck build keyed on upload fingerprints instead of the uploads' full bytes.
+
+    Results are shared as they are between reruns and sessions, never pickled
+    or copied, so callers must treat them as read-only. At most MAX_ENTRIES
+    results are kept, each for TTL_SECONDS.
+    """
+    return st.cache_resource(
+        max_entries=MAX_ENTRIES,
+        ttl=TTL_SECONDS,
+        hash_funcs={UploadedFile: upload_fingerprint},
+    )(func)
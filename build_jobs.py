@@ -0,0 +1,271 @@
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from out_of_core import DEFAULT_SPILL_DIR
+from rate_build import build_outputs
+from result_export import MAIN_RESULTS, HIGH_RATE_RESULTS, export_results
+
+# --- Settings ---
+
+MAX_BUILD_WORKERS = int(os.environ.get("RATEBUILDER_BUILD_WORKERS", "2"))
+
+# Ingest processes all running jobs may use together; each job gets an equal share, at least one
+MAX_INGEST_PROCESSES = int(os.environ.get("RATEBUILDER_INGEST_PROCESSES", str(os.cpu_count() or 1)))
+DEFAULT_JOB_DIR = os.environ.get("RATEBUILDER_JOB_DIR", os.path.join(DEFAULT_SPILL_DIR, "ratebuilder_jobs"))
+
+# Seconds a finished job's results are kept
+JOB_TTL_SECONDS = int(os.environ.get("RATEBUILDER_JOB_TTL", "3600"))
+
+# Seconds an unfinished job may go unwatched before it counts as abandoned and is cancelled
+ABANDON_SECONDS = int(os.environ.get("RATEBUILDER_JOB_ABANDON_SECONDS", "300"))
+
+# Seconds between scheduler passes
+POLL_SECONDS = 0.5
+
+RESULT_FILE = "result.pkl"
+
+ACTIVE_STATES = ("queued", "running")
+
+# --- Jobs ---
+
+class BuildJob:
+    """One submitted build: its inputs and results directory, options and state.
+
+    state is queued, running, done, failed or cancelled. stage is the last
+    BUILD_STAGES entry the worker reported.
+    """
+
+    def __init__(self, job_id, owner, directory, options):
+        self.job_id = job_id
+        self.owner = owner
+        self.directory = directory
+        self.options = options
+        self.state = "queued"
+        self.stage = None
+        self.error = None
+        self.submitted = self.seen = time.monotonic()
+        self.started = self.finished = None
+        self.process = None
+        self.progress = None
+
+class BuildScheduler:
+    """Runs builds as background jobs in at most max_workers worker processes, shared by all sessions.
+
+    Jobs start in submission order, except that an owner with fewer running
+    jobs goes first, so one user queueing several builds cannot hold up the
+    others. Every job runs in its own process group and is cancelled by
+    killing the group, which stops its ingest workers too. Jobs nobody has
+    asked about for ABANDON_SECONDS are cancelled, and finished ones are
+    removed with their files after JOB_TTL_SECONDS. A job's ingest workers
+    are capped at its share of max_ingest_processes, so all jobs together
+    never run more ingest processes than that (or one each, if there are
+    more jobs than processes). A job is only visible to the owner that
+    submitted it: for anyone else, status, cancel and result treat it as
+    unknown.
+    """
+
+    def __init__(self, max_workers=MAX_BUILD_WORKERS, directory=DEFAULT_JOB_DIR,
+                 max_ingest_processes=MAX_INGEST_PROCESSES):
+        self.max_workers = max_workers
+        self.directory = directory
+        self.ingest_workers = max(1, max_ingest_processes // max_workers)
+        self._jobs = {}
+        # When each owner last had a job started, counted in job starts
+        self._last_starts = {}
+        self._starts = 0
+        self._lock = threading.Condition()
+        self._context = multiprocessing.get_context("spawn")
+        threading.Thread(target=self._run, name="build-scheduler", daemon=True).start()
+
+    def submit(self, owner, files, options):
+        """Queues a build of (file, filename) pairs with build_outputs keyword options, returning its job id.
+
+        The files are copied into the job's directory, so the caller may close
+        them once this returns. options may also hold the export_format and
+        final_decimal_places of the export. Ingest workers beyond the job's
+        share of the ingest processes are dropped.
+        """
+        options = {**options, "workers": min(options.get("workers", 1), self.ingest_workers)}
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.directory, job_id)
+        for number, (file, filename) in enumerate(files):
+            os.makedirs(os.path.join(directory, "inputs", str(number)))
+            file.seek(0)
+            with open(os.path.join(directory, "inputs", str(number), os.path.basename(filename)), "wb") as copy:
+                shutil.copyfileobj(file, copy, 1 << 20)
+        with self._lock:
+            self._jobs[job_id] = BuildJob(job_id, owner, directory, options)
+            self._lock.notify()
+        return job_id
+
+    def status(self, job_id, owner):
+        """Returns the state, stage, queue position, error and elapsed seconds of a job, or None if it is unknown.
+
+        Asking counts as watching the job, which keeps it from being cancelled as abandoned.
+        """
+        with self._lock:
+            job = self._owned(job_id, owner)
+            if job is None:
+                return None
+            self._update()
+            job.seen = time.monotonic()
+            queue = self._queue_order()
+            return {
+                "state": job.state, "stage": job.stage, "error": job.error,
+                "position": queue.index(job) + 1 if job in queue else None, "queued": len(queue),
+                "elapsed": (job.finished or time.monotonic()) - (job.started or job.submitted),
+            }
+
+    def cancel(self, job_id, owner):
+        with self._lock:
+            job = self._owned(job_id, owner)
+            if job is not None and job.state in ACTIVE_STATES:
+                self._stop(job, "cancelled")
+                self._lock.notify()
+
+    def result(self, job_id, owner):
+        """Returns the build_outputs dict of a finished job, with the paths of its exported files, or None."""
+        with self._lock:
+            job = self._owned(job_id, owner)
+            if job is None or job.state != "done":
+                return None
+            directory = job.directory
+        with open(os.path.join(directory, RESULT_FILE), "rb") as f:
+            return pickle.load(f)
+
+    def _owned(self, job_id, owner):
+        """Returns the job if owner submitted it, else None, so other owners cannot tell it exists."""
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def _run(self):
+        with self._lock:
+            while True:
+                self._update()
+                self._lock.wait(POLL_SECONDS)
+
+    def _update(self):
+        """Collects progress, retires finished and abandoned jobs, and starts queued ones while workers are free."""
+        now = time.monotonic()
+        for job in list(self._jobs.values()):
+            if job.state == "running":
+                self._collect(job)
+            if job.state in ACTIVE_STATES and now - job.seen > ABANDON_SECONDS:
+                self._stop(job, "cancelled")
+            elif job.state not in ACTIVE_STATES and now - job.finished > JOB_TTL_SECONDS:
+                shutil.rmtree(job.directory, ignore_errors=True)
+                del self._jobs[job.job_id]
+
+        queue = self._queue_order()
+        running = sum(job.state == "running" for job in self._jobs.values())
+        for job in queue[:max(0, self.max_workers - running)]:
+            self._start(job)
+
+    def _queue_order(self):
+        """Orders the queued jobs the way they will start.
+
+        The owner with the fewest running jobs goes first, then the one whose
+        last job started longest ago, then the earliest submitted job.
+        """
+        running = Counter(job.owner for job in self._jobs.values() if job.state == "running")
+        last_starts = dict(self._last_starts)
+        queued = [job for job in self._jobs.values() if job.state == "queued"]
+        order = []
+        while queued:
+            job = min(queued, key=lambda queued_job: (running[queued_job.owner], last_starts.get(queued_job.owner, -1)))
+            queued.remove(job)
+            running[job.owner] += 1
+            last_starts[job.owner] = self._starts + len(order)
+            order.append(job)
+        return order
+
+    def _start(self, job):
+        job.progress, sender = self._context.Pipe(duplex=False)
+        job.process = self._context.Process(
+            target=run_build_job, args=(job.directory, job.options, sender), name=f"build-{job.job_id}"
+        )
+        job.process.start()
+        sender.close()
+        job.state, job.started = "running", time.monotonic()
+        self._last_starts[job.owner] = self._starts
+        self._starts += 1
+
+    def _collect(self, job):
+        """Reads the stages a worker reported and notices when it exits."""
+        # Checked before reading, so an outcome sent just before exiting is never missed
+        exited = job.process.exitcode is not None
+        try:
+            while job.progress.poll():
+                kind, value = job.progress.recv()
+                if kind == "stage":
+                    job.stage = value
+                else:
+                    job.state, job.error = kind, value
+        except EOFError:
+            pass
+        if job.state == "running" and exited:
+            job.state, job.error = "failed", f"Build worker exited with code {job.process.exitcode}"
+        if job.state != "running":
+            self._finish(job)
+
+    def _stop(self, job, state):
+        if job.state == "running":
+            try:
+                os.killpg(job.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            # A worker killed before it made its own process group is only reached directly
+            job.process.kill()
+        job.state = state
+        self._finish(job)
+
+    def _finish(self, job):
+        if job.process is not None:
+            job.process.join()
+            job.progress.close()
+            job.process = job.progress = None
+        job.finished = time.monotonic()
+
+# --- Worker ---
+
+def run_build_job(directory, options, progress):
+    """Builds a job's inputs in a worker process, reporting stages and the outcome through the progress pipe."""
+    os.setpgrp()
+    try:
+        options = dict(options)
+        export_format = options.pop("export_format", "zip")
+        final_decimal_places = options.pop("final_decimal_places", 6)
+        inputs = os.path.join(directory, "inputs")
+        paths = [
+            os.path.join(inputs, number, name)
+            for number in sorted(os.listdir(inputs), key=int) for name in os.listdir(os.path.join(inputs, number))
+        ] if os.path.isdir(inputs) else []
+
+        @contextmanager
+        def reported(stage):
+            progress.send(("stage", stage))
+            yield
+
+        with ExitStack() as stack:
+            files = [(stack.enter_context(open(path, "rb")), os.path.basename(path)) for path in paths]
+            outputs = build_outputs(files, **options, stage=reported)
+        outputs["exports"] = export_results(
+            {MAIN_RESULTS: outputs["result_table"], HIGH_RATE_RESULTS: outputs["high_rate_table"]}, export_format,
+            final_decimal_places
+        )
+        with open(os.path.join(directory, RESULT_FILE), "wb") as f:
+            pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(inputs, ignore_errors=True)
+        progress.send(("done", None))
+    except Exception as e:
+        progress.send(("failed", f"{type(e).__name__}: {e}"))
+    finally:
+        progress.close()
@@ -0,0 +1,339 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from prefix_index import PrefixIndex, MAX_DIGITS, digit_values
+
+# --- Settings ---
+
+# Bytes of CDR file read at a time; memory is bounded by a small multiple of this
+DEFAULT_BLOCK_BYTES = int(os.environ.get("RATEBUILDER_CDR_BLOCK_MB", "32")) * 2 ** 20
+
+# Rates in the deck are per minute
+SECONDS_PER_RATE_UNIT = 60
+
+# Decimals of the cost written to rated rows
+COST_DECIMALS = 6
+
+# Lower-cased CDR headers of the dialed number and the duration in seconds, else the first two columns
+NUMBER_HEADERS = ("number", "dialed number", "called number", "destination")
+DURATION_HEADERS = ("duration", "billsec", "seconds")
+
+# Columns appended to every CDR line in the rated rows
+RATED_COLUMNS = ("Prefix", "Vendor Source File", "Rate", "Billed Seconds", "Cost")
+
+# Lines parsed and priced at a time within a block, sized to keep the working matrices in cache
+SUB_BLOCK_LINES = 1 << 14
+
+# Widest number and duration fields parsed, in bytes; longer ones are rejected
+NUMBER_FIELD_BYTES = 24
+DURATION_FIELD_BYTES = 16
+FIELD_WINDOW_BYTES = max(NUMBER_FIELD_BYTES, DURATION_FIELD_BYTES)
+
+# Bytes trimmed from the front and the back of a field
+_TRIMMED_FRONT = np.zeros(256, dtype=bool)
+_TRIMMED_FRONT[[ord("+"), ord('"'), ord(" "), ord("\t")]] = True
+_TRIMMED_BACK = np.zeros(256, dtype=bool)
+_TRIMMED_BACK[[ord('"'), ord(" "), ord("\t")]] = True
+
+# --- Billing Schemes ---
+
+def parse_billing_schemes(schemes):
+    """Returns the first and next billing increments, in seconds, of "first/next" billing schemes.
+
+    A lone number is both increments ("60" bills like "60/60"). Blank or
+    unreadable schemes bill per second.
+    """
+    schemes = pd.Series(np.asarray(schemes, dtype=object)).fillna("").astype(str)
+    increments = schemes.str.extract(r"^\s*(\d+)\s*(?:[/+-]\s*(\d+))?\s*$")
+    first = pd.to_numeric(increments[0], errors="coerce").fillna(1).to_numpy(dtype=np.int64)
+    following = pd.to_numeric(increments[1], errors="coerce").fillna(pd.Series(first)).to_numpy(dtype=np.int64)
+    return first, np.maximum(following, 1)
+
+def billed_seconds(durations, first, following):
+    """Rounds call durations up to the billing increments: the first, then whole steps of the next."""
+    steps = np.ceil(np.maximum(durations - first, 0.0) / following)
+    return np.where(durations > 0.0, first + steps * following, 0.0)
+
+# --- Rating ---
+
+class CdrRater:
+    """Prices dialed numbers at the LCR rate of their longest priced prefix in an LCR table.
+
+    Only prefixes with a quote for rate_type are indexed, so a number under
+    an unpriced prefix falls back to the longest priced prefix enclosing it.
+    The cost of a call is its rate times its billed seconds, per minute.
+    """
+
+    def __init__(self, lcr_results, rate_type="vendor_rates"):
+        self.lcr_results = lcr_results
+        self.rate_type = rate_type
+        self.rates = lcr_results[f"lcr_{rate_type}"].to_numpy(dtype=np.float64)
+        self.sources = lcr_results[f"source_{rate_type}"].fillna("").to_numpy(dtype=object)
+        self.first, self.following = parse_billing_schemes(lcr_results["billing_scheme"])
+        self.index = PrefixIndex(lcr_results["prefix"].where(self.sources != "", ""))
+
+        # ",prefix,source,rate," of every row, CSV-quoted, as a byte matrix for the rated rows
+        row_text = pd.DataFrame({
+            "prefix": lcr_results["prefix"], "source": self.sources, "rate": self.rates
+        }).to_csv(header=False, index=False, lineterminator="\n", float_format="%.10g").split("\n")[:-1]
+        self._row_text = _byte_matrix([b"," + text.encode() + b"," for text in row_text] + [b",,,,"])
+
+    def rate(self, padded, lengths, durations):
+        """Returns the table row (-1 if unpriced), billed seconds and cost of parsed calls."""
+        rows = self.index.match_padded(padded, lengths)
+        rated = (rows >= 0) & ~np.isnan(durations)
+        rows = np.where(rated, rows, -1)
+        billed = np.where(rated, billed_seconds(durations, self.first[rows], self.following[rows]), 0.0)
+        return rows, billed, np.where(rated, self.rates[rows] * billed / SECONDS_PER_RATE_UNIT, 0.0)
+
+class CdrTotals:
+    """Calls, seconds, billed seconds and cost per row of an LCR table, added up a block of CDRs at a time."""
+
+    def __init__(self, size):
+        self.calls = np.zeros(size, dtype=np.int64)
+        self.seconds = np.zeros(size)
+        self.billed_seconds = np.zeros(size)
+        self.cost = np.zeros(size)
+        self.unpriced = 0
+        self.rejected = 0
+
+    def add(self, rows, durations, billed, cost, rejected):
+        priced = rows[rows >= 0]
+        size = len(self.calls)
+        self.calls += np.bincount(priced, minlength=size)
+        self.seconds += np.bincount(priced, weights=durations[rows >= 0], minlength=size)
+        self.billed_seconds += np.bincount(priced, weights=billed[rows >= 0], minlength=size)
+        self.cost += np.bincount(priced, weights=cost[rows >= 0], minlength=size)
+        self.unpriced += int(len(rows) - len(priced) - rejected)
+        self.rejected += int(rejected)
+
+    def prefix_costs(self, rater):
+        """Returns one row per called prefix, with its LCR vendor file, rate and totals."""
+        called = np.flatnonzero(self.calls)
+        table = rater.lcr_results.iloc[called]
+        return pd.DataFrame({
+            "prefix": table["prefix"].to_numpy(),
+            "description": table["description"].to_numpy(),
+            "currency": table["currency"].to_numpy(),
+            "billing_scheme": table["billing_scheme"].to_numpy(),
+            "source": rater.sources[called],
+            "rate": rater.rates[called],
+            "calls": self.calls[called],
+            "seconds": self.seconds[called],
+            "billed_seconds": self.billed_seconds[called],
+            "cost": self.cost[called],
+        })
+
+def vendor_costs(prefix_costs):
+    """Rolls the per-prefix totals up per vendor file and currency, costliest first."""
+    totals = ["calls", "seconds", "billed_seconds", "cost"]
+    return (
+        prefix_costs.groupby(["source", "currency"], sort=False)[totals].sum()
+        .reset_index().sort_values("cost", ascending=False, ignore_index=True)
+    )
+
+def rate_cdr_file(file, rater, rated_rows=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Rates a CDR file a block at a time. Returns the per-prefix totals and the counts of unpriced and rejected calls.
+
+    file is a path or a binary file object holding a CSV with a header row,
+    the dialed number and the duration in seconds, plus any other columns
+    (such as a timestamp), without quoted commas. When rated_rows, a binary
+    file object, is given, every CDR line is copied to it with the
+    RATED_COLUMNS appended. Lines without the header's number of fields are
+    rejected and left unpriced.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as opened:
+            return rate_cdr_file(opened, rater, rated_rows, block_bytes)
+
+    header = file.readline().removeprefix(b"\xef\xbb\xbf")
+    fields = [field.strip().strip('"').lower() for field in header.decode(errors="replace").strip().split(",")]
+    number_field = next((fields.index(name) for name in NUMBER_HEADERS if name in fields), 0)
+    duration_field = next((fields.index(name) for name in DURATION_HEADERS if name in fields), 1)
+    if rated_rows is not None:
+        content = header.rstrip(b"\r\n")
+        rated_rows.write(content + ("," + ",".join(RATED_COLUMNS)).encode() + (header[len(content):] or b"\n"))
+
+    totals = CdrTotals(len(rater.lcr_results))
+    for block in _line_blocks(file, block_bytes):
+        buffer = np.frombuffer(block, dtype=np.uint8)
+        lines = _split_lines(buffer, len(fields), (number_field, duration_field))
+        windows = _field_windows(buffer)
+        for start in range(0, len(lines["starts"]), SUB_BLOCK_LINES):
+            sub_block = {key: values[start:start + SUB_BLOCK_LINES] for key, values in lines.items()}
+            padded, lengths = _parse_numbers(windows, sub_block["starts", number_field], sub_block["ends", number_field])
+            durations = _parse_durations(windows, sub_block["starts", duration_field], sub_block["ends", duration_field])
+            valid = sub_block["valid"]
+            rows, billed, cost = rater.rate(padded, np.where(valid, lengths, 0), np.where(valid, durations, np.nan))
+            totals.add(rows, durations, billed, cost, np.count_nonzero(~valid))
+            if rated_rows is not None:
+                rated_rows.write(_rated_lines(buffer, sub_block, rater, rows, billed, cost))
+
+    return totals.prefix_costs(rater), totals.unpriced, totals.rejected
+
+# --- Byte Kernels ---
+
+def _line_blocks(file, block_bytes):
+    """Yields blocks of whole lines, each about block_bytes long."""
+    carry = b""
+    while block := file.read(block_bytes):
+        block = carry + block
+        cut = block.rfind(b"\n") + 1
+        carry = block[cut:]
+        if cut:
+            yield block[:cut]
+    if carry.strip():
+        yield carry + b"\n"
+
+def _split_lines(buffer, field_count, fields):
+    """Finds the lines of a block and the spans of some of their fields, blanks and quotes trimmed.
+
+    Returns the start, content end (before any "\r") and next line start of
+    every line, whether it holds field_count fields, and under ("starts",
+    field) and ("ends", field) the span of each field in fields.
+    """
+    newlines = np.flatnonzero(buffer == ord("\n"))
+    starts = np.concatenate([[0], newlines[:-1] + 1])
+    ends = newlines - ((buffer[np.maximum(newlines - 1, 0)] == ord("\r")) & (newlines > starts))
+    commas = np.append(np.flatnonzero(buffer == ord(",")), len(buffer))
+    first_comma = np.searchsorted(commas, starts)
+    comma_counts = np.searchsorted(commas, newlines) - first_comma
+    lines = {
+        "starts": starts, "ends": ends, "next": newlines + 1,
+        "valid": (comma_counts == field_count - 1) & (ends > starts),
+    }
+
+    last = len(commas) - 1
+    for field in fields:
+        field_starts = starts if field == 0 else np.where(
+            field <= comma_counts, commas[np.minimum(first_comma + field - 1, last)] + 1, ends
+        )
+        field_ends = np.where(field < comma_counts, commas[np.minimum(first_comma + field, last)], ends)
+        lines["starts", field], lines["ends", field] = _trimmed(buffer, field_starts, field_ends)
+    return lines
+
+def _trimmed(buffer, starts, ends):
+    """Moves field spans past leading blanks, quotes and "+" signs, and before trailing blanks and quotes."""
+    while (front := (starts < ends) & _TRIMMED_FRONT[buffer[np.minimum(starts, len(buffer) - 1)]]).any():
+        starts = starts + front
+    while (back := (starts < ends) & _TRIMMED_BACK[buffer[np.maximum(ends - 1, 0)]]).any():
+        ends = ends - back
+    return starts, ends
+
+def _field_windows(buffer):
+    """Returns a view of the FIELD_WINDOW_BYTES bytes around every position of a block, zero outside it.
+
+    Row FIELD_WINDOW_BYTES + i starts at byte i, so one fancy index reads a
+    field left-aligned from its start or right-aligned up to its end.
+    """
+    padding = np.zeros(FIELD_WINDOW_BYTES, dtype=np.uint8)
+    return np.lib.stride_tricks.sliding_window_view(np.concatenate([padding, buffer, padding]), FIELD_WINDOW_BYTES)
+
+def _parse_numbers(windows, starts, ends):
+    """Reads dialed numbers as MAX_DIGITS-digit integers padded with zeros, and their digit counts (0 if invalid)."""
+    lengths = ends - starts
+    inside = _aligned(NUMBER_FIELD_BYTES, lengths)
+    digits = (windows[starts + FIELD_WINDOW_BYTES, :NUMBER_FIELD_BYTES] - np.uint8(ord("0"))) * inside
+    valid = (lengths > 0) & (lengths <= NUMBER_FIELD_BYTES) & ~_flagged_rows(digits >= 10)
+    padded = digit_values(digits[:, :MAX_DIGITS])
+    return np.where(valid, padded, 0), np.where(valid, np.minimum(lengths, MAX_DIGITS), 0)
+
+def _parse_durations(windows, starts, ends):
+    """Reads non-negative decimal durations, NaN where a field is not one.
+
+    Fields are read right-aligned, so whole seconds take fixed place values
+    and come out of one matrix product. Only fields holding anything other
+    than digits, such as a decimal point, are read digit by digit.
+    """
+    width = DURATION_FIELD_BYTES
+    lengths = ends - starts
+    inside = _aligned(width, lengths, right=True)
+    characters = windows[ends + FIELD_WINDOW_BYTES - width, :width]
+    digits = (characters - np.uint8(ord("0"))) * inside
+    values = np.where((lengths > 0) & (lengths <= width), digits.astype(np.float64) @ _DURATION_PLACES, np.nan)
+
+    irregular = np.flatnonzero(_flagged_rows(digits >= 10))
+    if len(irregular):
+        characters, inside, digits = characters[irregular], inside[irregular], digits[irregular]
+        is_digit = inside & (digits < 10)
+        points = inside & (characters == ord("."))
+        columns = np.arange(width)
+        point_columns = np.where(points.any(axis=1), points.argmax(axis=1), width)[:, None]
+        exponents = point_columns - columns - 1 + (columns > point_columns)
+        readable = is_digit.any(axis=1) & (is_digit | points | ~inside).all(axis=1) & (points.sum(axis=1) <= 1)
+        values[irregular] = np.where(
+            readable & (lengths[irregular] <= width), np.where(is_digit, digits * 10.0 ** exponents, 0.0).sum(axis=1), np.nan
+        )
+    return values
+
+# Place value of every column of a right-aligned duration without a decimal point
+_DURATION_PLACES = 10.0 ** np.arange(DURATION_FIELD_BYTES - 1, -1, -1)
+
+def _aligned(width, kept, right=False):
+    """Masks keeping the first (or, if right, the last) kept columns of rows width columns wide."""
+    masks = np.arange(width) < np.arange(width + 1)[:, None]
+    return (masks[:, ::-1] if right else masks)[np.clip(kept, 0, width)]
+
+def _flagged_rows(flags):
+    """Flags the rows of a boolean matrix, a multiple of 8 columns wide, with any column set, reading 8 at a time."""
+    words = np.ascontiguousarray(flags).view(np.uint64)
+    flagged = words[:, 0].copy()
+    for column in range(1, words.shape[1]):
+        flagged |= words[:, column]
+    return flagged != 0
+
+def _byte_matrix(texts):
+    """Lays byte strings out as a (strings, widest) matrix and the length of each."""
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    matrix = np.zeros((len(texts), max(lengths.max(initial=0), 1)), dtype=np.uint8)
+    flat = np.frombuffer(b"".join(texts), dtype=np.uint8)
+    matrix[np.repeat(np.arange(len(texts)), lengths), np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)] = flat
+    return matrix, lengths
+
+def _digit_matrix(values, min_width=1):
+    """Writes non-negative integers as right-aligned decimal digits, at least min_width wide. Returns the digits and how many to keep."""
+    largest = int(values.max(initial=0))
+    width = max(len(str(largest)), min_width)
+    # Narrow unsigned division is the cheapest there is
+    values = values.astype(np.uint32 if largest < 2 ** 32 else np.uint64)
+    lengths = np.searchsorted(_POWERS_OF_TEN, values, side="right") + 1
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    for column in range(width - 1, -1, -1):
+        digits[:, column] = values % 10
+        values //= 10
+    return digits + np.uint8(ord("0")), lengths
+
+_POWERS_OF_TEN = 10 ** np.arange(1, 20, dtype=np.uint64)
+
+def _rated_lines(buffer, lines, rater, rows, billed, cost):
+    """Copies some consecutive lines of a block with the rated columns appended before each line ending."""
+    row_text, row_lengths = rater._row_text
+    rated = rows >= 0
+    billed_digits, billed_lengths = _digit_matrix(billed.astype(np.int64))
+    cost_digits, cost_lengths = _digit_matrix(np.rint(cost * 10 ** COST_DECIMALS).astype(np.int64), COST_DECIMALS + 1)
+    whole_columns = cost_digits.shape[1] - COST_DECIMALS
+    cost_lengths = np.maximum(cost_lengths, COST_DECIMALS + 1) + 1
+
+    # Column blocks of the appended text and the bytes kept of each: the row text left-aligned, the rest right-aligned
+    count = len(rows)
+    blocks = [
+        (row_text[rows], _aligned(row_text.shape[1], row_lengths[rows])),
+        (billed_digits, _aligned(billed_digits.shape[1], billed_lengths * rated, right=True)),
+        (np.full((count, 1), ord(","), dtype=np.uint8), np.ones((count, 1), dtype=bool)),
+        (cost_digits[:, :whole_columns], _aligned(whole_columns, (cost_lengths - COST_DECIMALS - 1) * rated, right=True)),
+        (np.full((count, 1), ord("."), dtype=np.uint8), rated[:, None]),
+        (cost_digits[:, whole_columns:], np.repeat(rated[:, None], COST_DECIMALS, axis=1)),
+    ]
+    appended = np.concatenate([text for text, _ in blocks], axis=1)[np.concatenate([keep for _, keep in blocks], axis=1)]
+    appended_lengths = row_lengths[rows] + 1 + rated * (billed_lengths + cost_lengths)
+
+    # Merge the appended text into the lines in front of every line ending
+    first, after = lines["starts"][0], lines["next"][-1]
+    output = np.empty(after - first + len(appended), dtype=np.uint8)
+    inserted = np.zeros(len(output), dtype=bool)
+    inserted[np.repeat(lines["ends"] - first, appended_lengths) + np.arange(len(appended))] = True
+    output[inserted] = appended
+    output[~inserted] = buffer[first:after]
+    return output.tobytes()
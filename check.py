@@ -1,9 +1,10 @@
 import streamlit as st
-import csv
-from collections import defaultdict
+import numpy as np
 import pandas as pd
-import zipfile
-import io
+from deck_ingest import ingest_vendor_files
+from parse_cache import ParseCache
+from app_cache import cache_deck_build
+from lcr_engine import cheapest_averages
 
 # --- Helper Functions ---
 def clean_filename(filename):
@@ -12,105 +13,52 @@ def clean_filename(filename):
         filename = filename.replace("dial_peer", "")
     return filename.replace(".csv", "").replace(".zip", "").replace("_", " ")
 
-def calculate_average_of_cheapest(rates_with_files, n=4, exclude_first_cheapest=True, included_vendors=None, excluded_vendors=None):
-    """Calculate the average of the cheapest n rates after applying include/exclude filters."""
-    rates_with_files = sorted([(float(rate), file) for rate, file in rates_with_files if str(rate).strip() and float(rate) >= 0.0 and
-                              ((included_vendors is None or clean_filename(file) in included_vendors) and
-                               (excluded_vendors is None or clean_filename(file) not in excluded_vendors))])
-    
-    # Check if any rates are zero
-    zero_rates = [rate for rate, _ in rates_with_files if float(rate) == 0.0]
+def vendor_mask(rate_deck, included_vendors=None, excluded_vendors=None):
+    """Flags the sources of a deck that pass the include/exclude filters, cleaning each file name once."""
+    included = None if included_vendors is None else set(included_vendors)
+    excluded = None if excluded_vendors is None else set(excluded_vendors)
+    names = [clean_filename(source) for source in rate_deck.sources]
+    return np.array(
+        [(included is None or name in included) and (excluded is None or name not in excluded) for name in names],
+        dtype=bool,
+    )
+
+def calculate_average_of_cheapest(rate_deck, rate_type, n=4, exclude_first_cheapest=True, included_vendors=None, excluded_vendors=None):
+    """Calculate the average of the cheapest n rates of every prefix after applying include/exclude filters.
+
+    Returns the averages and the file holding the cheapest averaged rate (None if there is none), per prefix.
+    """
+    source_mask = None
+    if included_vendors is not None or excluded_vendors is not None:
+        source_mask = vendor_mask(rate_deck, included_vendors, excluded_vendors)
+    averages, cheapest_sources, zero_rates = cheapest_averages(rate_deck, rate_type, n, exclude_first_cheapest, source_mask)
+
+    # Roll the zero checks up into one warning each instead of one per prefix
     if zero_rates:
-        st.warning(f"Warning: There are {len(zero_rates)} rates that are 0.")
+        st.warning(f"Warning: There are {zero_rates} rates that are 0.")
+    zero_averages = int((averages == 0.0).sum())
+    if zero_averages:
+        st.warning(f"Warning: The calculated average rate is 0 for {zero_averages} prefixes.")
 
-    if exclude_first_cheapest and len(rates_with_files) > 0:
-        rates_with_files.pop(0)  # Remove the first cheapest rate
+    cheapest_files = np.append(rate_deck.sources, None)[cheapest_sources]
+    return averages, cheapest_files
 
-    selected_rates = rates_with_files[:n] if len(rates_with_files) >= n else rates_with_files
-    avg_rate = round(sum(rate for rate, _ in selected_rates) / len(selected_rates), 6) if selected_rates else 0.0
-    
-    # Check if the calculated average rate is zero
-    if avg_rate == 0.0:
-        st.warning("Warning: The calculated average rate is 0.")
-
-    cheapest_file = selected_rates[0][1] if selected_rates else None
-    return avg_rate, cheapest_file
-
-def create_prefix_dict():
-    """Creates a dictionary to store data for each prefix."""
-    return {
-        "inter_vendor_rates": [],
-        "intra_vendor_rates": [],
-        "vendor_rates": [],
-        "description": None,
-        "currency": None,
-        "billing_scheme": None,
-        "cheapest_file": {}
-    }
-
-# Initialize file_summary outside to ensure it's always available
-file_summary = defaultdict(lambda: {"rows": 0, "missing": 0, "valid": 0})
-
-# Cache data using st.cache_resource for resources that are not serializable
-@st.cache_resource
+@cache_deck_build
 def process_csv_data(uploaded_files):
-    """Processes CSV data from uploaded files and generates a summary before final processing."""
-    prefix_data = defaultdict(create_prefix_dict)
-    summary_results = {}
-
-    for uploaded_file in uploaded_files:
-        if uploaded_file.name.endswith('.zip'):
-            with zipfile.ZipFile(uploaded_file, 'r') as z:
-                for inner_filename in z.namelist():
-                    if inner_filename.endswith('.csv'):
-                        with z.open(inner_filename) as file:
-                            count_and_summarize(file, inner_filename, file_summary)
-                            read_and_process_csv(file, prefix_data, inner_filename, file_summary)
-        else:
-            count_and_summarize(uploaded_file, uploaded_file.name, file_summary)
-            read_and_process_csv(uploaded_file, prefix_data, uploaded_file.name, file_summary)
-
-    # Return only serializable data
-    summary_results["prefix_data"] = prefix_data
-    summary_results["file_summary"] = dict(file_summary)
-    return summary_results
-
-def count_and_summarize(file, filename, summary):
-    """Counts the rows in a file and checks for missing data."""
-    try:
-        file_text = file.read().decode('utf-8')
-    except UnicodeDecodeError:
-        file_text = file.read().decode('latin-1')
-    reader = csv.DictReader(io.StringIO(file_text))
-    row_count = 0
-    missing_count = 0
-    for row in reader:
-        row_count += 1
-        if not row.get("Prefix") or not row.get("Rate (vendor's currency)"):
-            missing_count += 1
-    
-    summary[filename]["rows"] = row_count
-    summary[filename]["missing"] = missing_count
-    summary[filename]["valid"] = row_count - missing_count
-
-def read_and_process_csv(file, prefix_data, filename, file_summary):
-    """Reads and processes CSV file data."""
-    try:
-        file_text = file.read().decode('utf-8')
-    except UnicodeDecodeError:
-        file_text = file.read().decode('latin-1')
-    reader = csv.DictReader(io.StringIO(file_text))
-    for row in reader:
-        process_row(prefix_data, row, filename, file_summary)
-
-def process_row(prefix_data, row, filename, file_summary):
-    """Processes each row of the CSV file."""
-    prefix = row["Prefix"]
-    data = prefix_data[prefix]
-    data["inter_vendor_rates"].append((row.get("Rate (inter, vendor's currency)", 0), filename))
-    data["intra_vendor_rates"].append((row.get("Rate (intra, vendor's currency)", 0), filename))
-    data["vendor_rates"].append((row.get("Rate (vendor's currency)", 0), filename))
-    file_summary[filename]["valid"] += 1  # Track number of valid entries
+    """Builds the rate deck and the per-file row, missing and valid counts in one pass over the uploads."""
+    rate_deck, _, _, file_summaries = ingest_vendor_files(
+        [(uploaded_file, uploaded_file.name) for uploaded_file in uploaded_files], parse_cache=ParseCache()
+    )
+
+    file_summary = {
+        summary["filename"]: {
+            "rows": summary["row_count"],
+            "missing": summary["missing_count"],
+            "valid": summary["row_count"] - summary["missing_count"],
+        }
+        for summary in file_summaries
+    }
+    return {"rate_deck": rate_deck, "file_summary": file_summary}
 
 # --- Streamlit App Interface ---
 st.title("CSV Rate Aggregator with File Summary")
@@ -119,7 +67,7 @@ uploaded_files = st.file_uploader("Upload CSV or ZIP files", type=["csv", "zip"]
 
 if uploaded_files:
     result = process_csv_data(uploaded_files)
-    prefix_data = result["prefix_data"]
+    rate_deck = result["rate_deck"]
     file_summary = result["file_summary"]
 
     # Display file summaries before final processing
@@ -0,0 +1,191 @@
+import io
+import mmap
+import multiprocessing
+import resource
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from rate_ingest import ingest_vendor_csv, ingest_rate_columns
+from rate_deck import RateDeckBuilder, BoundedDeckBuilder
+from high_rates import build_high_rate_index
+
+# --- Partial Aggregates ---
+
+def new_deck_builder(keep_cheapest=None, partial=False):
+    """Returns a complete deck builder, or a bounded one keeping the keep_cheapest cheapest quotes."""
+    return RateDeckBuilder() if keep_cheapest is None else BoundedDeckBuilder(keep_cheapest, partial)
+
+def ingest_partial(file, source, keep_cheapest=None, parse_cache=None, deck_builder=None):
+    """Parses one vendor CSV into a partial aggregate that merges into a deck builder.
+
+    Returns a deck builder holding only this file, its vendor names, its
+    Pre-Execution Summary counts and its peak rates per prefix. file may be raw
+    bytes, so the call can be shipped to a worker process. With a parse cache
+    the file is hashed first and only parsed if its bytes are not cached yet;
+    either way it is streamed chunk by chunk.
+    Given a deck_builder, the rows go straight into it and it is returned
+    instead of a new partial.
+    """
+    if deck_builder is None:
+        deck_builder = new_deck_builder(keep_cheapest, partial=True)
+    if parse_cache is not None:
+        names, summary, peaks = ingest_rate_columns(parse_cache.iter_rate_columns(file), source, deck_builder)
+    else:
+        if isinstance(file, bytes):
+            file = io.BytesIO(file)
+        names, summary, peaks = ingest_vendor_csv(file, source, deck_builder)
+    return deck_builder, names, summary, peaks
+
+def vendor_csvs(files):
+    """Yields (file, source, label) for every vendor CSV in (file, filename) pairs, expanding ZIPs.
+
+    ZIP members are opened one at a time and closed once the caller asks for the next.
+    """
+    for file, filename in files:
+        if filename.endswith('.zip'):
+            with open_archive(file) as z:
+                for inner_filename in z.namelist():
+                    if inner_filename.endswith('.csv'):
+                        with z.open(inner_filename) as f:
+                            yield f, inner_filename, inner_filename.replace('.csv', '')
+        elif filename.endswith('.csv'):
+            yield file, filename.replace('.csv', ''), filename.replace('.csv', '')
+
+# --- Archives ---
+
+def spool_to_disk(chunks):
+    """Writes chunks of bytes once to a temporary file on disk and returns it rewound."""
+    spool = tempfile.TemporaryFile()
+    for chunk in chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+@contextmanager
+def open_archive(file):
+    """Opens a ZIP without copying its bytes.
+
+    In-memory uploads are read in place. Anything else, such as a spooled
+    download, is memory-mapped from its file descriptor.
+    """
+    if isinstance(file, io.BytesIO):
+        file.seek(0)
+        with zipfile.ZipFile(file, 'r') as z:
+            yield z
+        return
+    file.flush()
+    with MappedFile(file.fileno()) as mapped, zipfile.ZipFile(mapped, 'r') as z:
+        yield z
+
+class MappedFile(io.RawIOBase):
+    """Read-only, seekable file over a memory map of a file descriptor."""
+
+    def __init__(self, fileno):
+        self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._map[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._map)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+        super().close()
+
+# --- Memory ---
+
+def peak_rss():
+    """Returns the peak RSS in bytes of this process since it started.
+
+    Only a process running one build, such as a CLI run, a background job or
+    an ingest worker, measures that build; the Streamlit server's own peak
+    covers every session it served.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            return 1024 * next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return 1024 * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# --- Ingest ---
+
+def ingest_vendor_files(files, keep_cheapest=None, workers=1, parse_cache=None):
+    """Ingests vendor CSVs and ZIPs of them into a RateDeck.
+
+    Every CSV is parsed inline into the deck builder or, with workers > 1,
+    into a partial aggregate in a pool of worker processes. Files whose bytes
+    are in parse_cache are not parsed again. Partials are merged in upload
+    order, so the deck is the same whatever the worker count. Returns the
+    deck, the sorted vendor names, a HighRateIndex and the per-file
+    summaries. A file parsed in a worker has the worker's peak RSS once it
+    was done in its summary (worker_peak_rss); the pool lives for this build
+    only, so that peak is this build's.
+    """
+    deck_builder = new_deck_builder(keep_cheapest)
+    vendor_names = set()
+    sources = []
+    file_peaks = []
+    file_summaries = []
+
+    def merge(partials):
+        for (source, label), (partial, names, summary, peaks) in partials:
+            if partial is not deck_builder:
+                deck_builder.merge(partial)
+            vendor_names.update(names)
+            sources.append(source)
+            file_peaks.append(peaks)
+            file_summaries.append({"filename": label, **summary})
+
+    if workers > 1:
+        # Forking the multithreaded Streamlit server can copy locks held by other threads, so workers are spawned
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            jobs = (
+                ((source, label), (f.read(), source, keep_cheapest, parse_cache))
+                for f, source, label in vendor_csvs(files)
+            )
+            merge(_ordered_map(pool, _measured_ingest_partial, jobs, 2 * workers))
+    else:
+        merge(
+            ((source, label), ingest_partial(f, source, keep_cheapest, parse_cache, deck_builder))
+            for f, source, label in vendor_csvs(files)
+        )
+
+    rate_deck = deck_builder.build()
+    return rate_deck, sorted(vendor_names), build_high_rate_index(rate_deck, sources, file_peaks), file_summaries
+
+def _measured_ingest_partial(*args):
+    """Runs ingest_partial in a pool worker, adding the worker's peak RSS so far to the file's summary."""
+    deck_builder, names, summary, peaks = ingest_partial(*args)
+    return deck_builder, names, {**summary, "worker_peak_rss": peak_rss()}, peaks
+
+def _ordered_map(pool, function, jobs, window):
+    """Runs (key, args) jobs on a pool and yields (key, result) in job order, at most window in flight."""
+    pending = deque()
+    for key, args in jobs:
+        pending.append((key, pool.submit(function, *args)))
+        if len(pending) >= window:
+            key, future = pending.popleft()
+            yield key, future.result()
+    while pending:
+        key, future = pending.popleft()
+        yield key, future.result()
@@ -1,7 +1,29 @@
 #!/bin/bash
 
-# Start Nginx
-service nginx start
+export RATEBUILDER_EXPORT_DIR=${RATEBUILDER_EXPORT_DIR:-/srv/ratebuilder/exports}
+mkdir -p "$RATEBUILDER_EXPORT_DIR"
+
+# The bundled nginx serves the export directory on 8081 and proxies the rest to the app on 8080.
+# Set RATEBUILDER_BUNDLED_NGINX=0 where a separate nginx fronts the apps, as in docker-stack.yaml.
+if [ "${RATEBUILDER_BUNDLED_NGINX:-1}" = "1" ]; then
+    # Export links are signed with one secret shared by the app and nginx.
+    # It has to come from outside: a secret made up per container would never match the one nginx checks.
+    : "${RATEBUILDER_EXPORT_SECRET:?set RATEBUILDER_EXPORT_SECRET to the export link secret shared with nginx}"
+
+    # Render the nginx config from its template on every start, so nginx always checks the current secret
+    escaped_secret=$(printf '%s' "$RATEBUILDER_EXPORT_SECRET" | sed 's/[\\|&]/\\&/g')
+    escaped_dir=$(printf '%s' "$RATEBUILDER_EXPORT_DIR" | sed 's/[\\|&]/\\&/g')
+    sed -e "s|\${RATEBUILDER_EXPORT_SECRET}|$escaped_secret|g" -e "s|\${RATEBUILDER_EXPORT_DIR}|$escaped_dir|g" \
+        /etc/nginx/ratebuilder.conf.template > /etc/nginx/sites-enabled/default
+
+    # Start Nginx
+    service nginx start
+fi
+
+# Run the service's command when one is given, as docker-stack.yaml and docker_compose.yaml do
+if [ "$#" -gt 0 ]; then
+    exec "$@"
+fi
 
 # Start each Streamlit app on a different port
 streamlit run telecall_rate_builder.py --server.port=8080 &
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES, concat_rate_columns
+
+# --- High-rate Index ---
+
+class HighRateIndex:
+    """Read-only index of the peak rates of every (file, prefix) pair.
+
+    Each entry holds the highest inter, intra and vendor rate one file quotes
+    for one prefix, in upload order. The entries are also kept sorted by the
+    highest of the three, so those above any threshold are found with a single
+    binary search and no vendor file has to be read again.
+    """
+
+    def __init__(self, files, file_ids, prefix_ids, rates):
+        peaks = np.fmax.reduce([rates[rate_type] for rate_type in RATE_TYPES])
+        order = np.argsort(peaks, kind="stable")
+
+        self._files = np.asarray(files, dtype=object)
+        self._file_ids = np.asarray(file_ids)
+        self._prefix_ids = np.asarray(prefix_ids)
+        self._rates = {rate_type: np.asarray(rates[rate_type]) for rate_type in RATE_TYPES}
+        self._order = order
+        self._peaks = peaks[order]
+        for array in (self._files, self._file_ids, self._prefix_ids, self._order, self._peaks, *self._rates.values()):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self._peaks)
+
+    @property
+    def files(self):
+        """Source label of every ingested file, indexed by file id."""
+        return self._files
+
+    def _above(self, rate_threshold):
+        """Returns the ids of the entries with a rate above the threshold, in sorted order."""
+        return self._order[np.searchsorted(self._peaks, rate_threshold, side="right"):]
+
+    def count(self, rate_threshold):
+        """Returns the number of (file, prefix) pairs with a rate above the threshold."""
+        return len(self) - int(np.searchsorted(self._peaks, rate_threshold, side="right"))
+
+    def file_counts(self, rate_threshold):
+        """Returns the number of prefixes with a rate above the threshold in every file."""
+        return np.bincount(self._file_ids[self._above(rate_threshold)], minlength=len(self._files))
+
+    def rows(self, rate_threshold):
+        """Returns the prefix id, source file and peak rates of the entries above the threshold, in upload order."""
+        entries = np.sort(self._above(rate_threshold))
+        rows = {"prefix_id": self._prefix_ids[entries], "source": self._files[self._file_ids[entries]]}
+        for rate_type in RATE_TYPES:
+            rows[rate_type] = self._rates[rate_type][entries]
+        return pd.DataFrame(rows)
+
+    def histogram(self, bins=50, quantile=0.99):
+        """Returns (counts, bin edges) of the peak rates.
+
+        The bins span 0 to the given quantile of the peaks, so a few extreme
+        rates do not flatten the chart. Peaks outside fall into the end bins.
+        """
+        upper = float(np.quantile(self._peaks, quantile)) if len(self) else 0.0
+        upper = upper if upper > 0.0 else 1.0
+        return np.histogram(np.clip(self._peaks, 0.0, upper), bins=bins, range=(0.0, upper))
+
+# --- Building ---
+
+def build_high_rate_index(deck, files, file_peaks):
+    """Builds a HighRateIndex from the peak_rates frame of every ingested file, in upload order."""
+    peaks = concat_rate_columns(file_peaks)
+    file_ids = np.repeat(np.arange(len(file_peaks), dtype=np.int32), [len(frame) for frame in file_peaks])
+    prefix_ids = pd.Index(deck.prefixes).get_indexer(np.asarray(peaks["prefix"].astype(str), dtype=object))
+
+    rates = {rate_type: peaks[rate_type].to_numpy(dtype="float64") for rate_type in RATE_TYPES}
+    quoted = ~np.isnan(np.fmax.reduce([rates[rate_type] for rate_type in RATE_TYPES]))
+    rates = {rate_type: values[quoted] for rate_type, values in rates.items()}
+    return HighRateIndex(files, file_ids[quoted], prefix_ids[quoted].astype(np.int64), rates)
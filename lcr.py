@@ -1,11 +1,12 @@
 import streamlit as st
-import csv
-from collections import defaultdict
+import numpy as np
 import pandas as pd
-import zipfile
 import requests
-import io
 from PIL import Image
+from rate_ingest import RATE_TYPES, high_rate_mask, ingest_rate_columns
+from parse_cache import ParseCache
+from deck_ingest import new_deck_builder, vendor_csvs, spool_to_disk
+from lcr_engine import lcr_table
 
 # --- Functions ---
 
@@ -28,21 +29,9 @@ def calculate_lcr_cost(rates, n):
         return rates[n - 1]
     return 0.0
 
-import zipfile
-import io
-import csv
-from collections import defaultdict
-
 def process_csv_data(uploaded_files, gdrive_url, rate_threshold=1.0):
-    """Processes CSV data to extract vendor names, prepare data structure, and check for high rates."""
-    prefix_data = defaultdict(lambda: {
-        "inter_vendor_rates": [],
-        "intra_vendor_rates": [],
-        "vendor_rates": [],
-        "description": None,
-        "currency": None,
-        "billing_scheme": None
-    })
+    """Ingests CSV data into a rate deck, collecting vendor names and checking for high rates."""
+    deck_builder = new_deck_builder()
     vendor_names = set()
     high_rate_prefixes = []  # Store prefixes with any rate above the threshold
     file_summaries = []  # Store total prefix count and high-rate count per file
@@ -54,106 +43,40 @@ def process_csv_data(uploaded_files, gdrive_url, rate_threshold=1.0):
     if gdrive_url:
         all_files.extend([(download_from_google_drive(gdrive_url)[0], "gdrive_file.zip")])
 
-    # Process each file
-    for file, filename in all_files:
-        if isinstance(file, io.BytesIO):
-            file_contents = file.getvalue()
-        else:
-            file_contents = file.read()
-
-        # Check if the file is a ZIP and process each CSV inside
-        if filename.endswith('.zip'):
-            with zipfile.ZipFile(io.BytesIO(file_contents), 'r') as z:
-                for inner_filename in z.namelist():
-                    if inner_filename.endswith('.csv'):
-                        with z.open(inner_filename) as f:
-                            prefix_count = set()  # Track unique prefixes per CSV
-                            high_rate_count = [0]  # Track high-rate count as a list to avoid TypeError
-                            vendor_names.update(process_individual_csv(
-                                f, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count
-                            ))
-                            # Append summary for each CSV inside the ZIP
-                            file_summaries.append({
-                                "filename": inner_filename,
-                                "total_prefix_count": len(prefix_count),
-                                "high_rate_count": high_rate_count[0]
-                            })
-        # Process regular CSV files directly
-        elif filename.endswith('.csv'):
-            prefix_count = set()  # Track unique prefixes per file
-            high_rate_count = [0]  # Initialize high-rate count as a list to avoid TypeError
-            vendor_names.update(process_individual_csv(
-                file, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count
-            ))
-            # Append summary for each standalone CSV
-            file_summaries.append({
-                "filename": filename,
-                "total_prefix_count": len(prefix_count),
-                "high_rate_count": high_rate_count[0]
-            })
-    
-    return prefix_data, sorted(vendor_names), high_rate_prefixes, file_summaries
-
-def process_individual_csv(file, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count):
-    """Processes a single CSV file to detect high rates and update counts."""
-    vendor_names = set()  # Track unique vendor names for filtering
-    try:
-        file_text = file.read().decode('utf-8')
-    except UnicodeDecodeError:
-        file_text = file.read().decode('latin-1')
-    reader = csv.DictReader(file_text.splitlines())
-
-    for row in reader:
-        vendor_name = row.get("Vendor", "").strip()
-        if vendor_name:
-            vendor_names.add(vendor_name)  # Add vendor name if it exists
-
-        prefix = row["Prefix"]
-        prefix_count.add(prefix)  # Track unique prefixes
-
-        data = prefix_data[prefix]
-        high_rate_found = False
-
-        # Check for high rates
-        for rate_key in ["Rate (inter, vendor's currency)", "Rate (intra, vendor's currency)", "Rate (vendor's currency)"]:
-            rate_value = row.get(rate_key, "").strip()
-            if rate_value:
-                try:
-                    rate_value_float = float(rate_value)
-                    if rate_value_float > rate_threshold:
-                        high_rate_found = True
-                except ValueError:
-                    pass
-
-        if high_rate_found:
-            high_rate_prefixes.append(prefix)  # Add prefix to high rates list
-            high_rate_count[0] += 1  # Increment high rate count
-
-        # Store each rate as a tuple (rate, None) if filename is not needed
-        if row.get("Rate (inter, vendor's currency)"):
-            data["inter_vendor_rates"].append((row.get("Rate (inter, vendor's currency)"), None))
-        if row.get("Rate (intra, vendor's currency)"):
-            data["intra_vendor_rates"].append((row.get("Rate (intra, vendor's currency)"), None))
-        if row.get("Rate (vendor's currency)"):
-            data["vendor_rates"].append((row.get("Rate (vendor's currency)"), None))
-
-        # Process metadata fields
-        data["description"] = data.get("description") or row.get("Description")
-        data["currency"] = data.get("currency") or row.get("Vendor's currency")
-        data["billing_scheme"] = data.get("billing_scheme") or row.get("Billing scheme")
-
-    return vendor_names
+    # Process each CSV, including those inside ZIPs
+    for file, source, label in vendor_csvs(all_files):
+        names, summary = process_individual_csv(file, source, deck_builder, high_rate_prefixes, rate_threshold)
+        vendor_names.update(names)
+        file_summaries.append({"filename": label, **summary})
+
+    return deck_builder.build(), sorted(vendor_names), high_rate_prefixes, file_summaries
+
+def process_individual_csv(file, source, deck_builder, high_rate_prefixes, rate_threshold):
+    """Streams a single CSV file into the deck builder and counts its prefixes with a rate above the threshold."""
+    names, summary, peaks = ingest_rate_columns(ParseCache().iter_rate_columns(file), source, deck_builder)
+    high_rate = high_rate_mask(peaks, rate_threshold)
+    high_rate_prefixes.extend(peaks["prefix"].astype(str).to_numpy()[high_rate])  # Add prefixes to high rates list
+    return names, {"total_prefix_count": summary["total_prefix_count"], "high_rate_count": int(high_rate.sum())}
+
+def lcr_results(rate_deck, lcr_n):
+    """Computes the averages and LCR costs of every prefix in the deck at once.
+
+    Matches calculate_average_rate and calculate_lcr_cost, including the
+    0.0 cost of prefixes with more than three but fewer than lcr_n rates.
+    """
+    table = lcr_table(rate_deck, lcr_n)
+    for rate_type in RATE_TYPES:
+        rates = rate_deck.rates(rate_type)
+        counts = np.bincount(rate_deck.group_ids(rate_type)[rates >= 0.0], minlength=len(rate_deck))
+        table.loc[(counts > 3) & (counts < lcr_n), f"lcr_{rate_type}"] = 0.0
+    return table
     
 def download_from_google_drive(url):
     try:
         response = requests.get(url, stream=True)
         response.raise_for_status()
 
-        file_data = io.BytesIO()
-        for chunk in response.iter_content(chunk_size=1048576):  # 1 MB chunks
-            file_data.write(chunk)
-        file_data.seek(0)
-        return [file_data]
+        return [spool_to_disk(response.iter_content(chunk_size=1048576))]  # 1 MB chunks
     except requests.exceptions.RequestException as e:
         st.error(f"Error downloading from Google Drive: {e}")
         return []
@@ -180,53 +103,19 @@ rate_threshold = st.number_input("Rate Threshold for High Rate Check", min_value
 
 # Process files and get vendor list after upload
 if uploaded_files or gdrive_url:
-    prefix_data, vendor_names, high_rate_prefixes, file_summaries = process_csv_data(uploaded_files, gdrive_url, rate_threshold)
+    rate_deck, vendor_names, high_rate_prefixes, file_summaries = process_csv_data(uploaded_files, gdrive_url, rate_threshold)
     
     # Display pre-execution summary
     st.subheader("Pre-Execution Summary")
     for summary in file_summaries:
         st.write(f"File: {summary['filename']}")
         st.write(f" - Total Prefix Count: {summary['total_prefix_count']}")
-        st.write(f" - Rates Above ${rate_threshold}: {summary['high_rate_count']}")
+        st.write(f" - Prefixes With Rates Above ${rate_threshold}: {summary['high_rate_count']}")
 
     selected_vendor = st.selectbox("Select Base Vendor Name (for filtering):", vendor_names)
 # Button to execute processing after selecting the vendor
 # Button to execute processing after selecting the vendor
 if st.button("Execute"):
-    results = []
-    for prefix, data in prefix_data.items():
-        if selected_vendor:
-            # Calculate averages
-            avg_inter_vendor = calculate_average_rate([rate if isinstance(rate, float) else rate[0] for rate in data["inter_vendor_rates"]])
-            avg_intra_vendor = calculate_average_rate([rate for rate, _ in data["intra_vendor_rates"]])
-            avg_vendor = calculate_average_rate([rate for rate, _ in data["vendor_rates"]])
-
-            # Calculate LCR costs
-            lcr_inter_vendor = calculate_lcr_cost([rate for rate, _ in data["inter_vendor_rates"]], lcr_n)
-            lcr_intra_vendor = calculate_lcr_cost([rate for rate, _ in data["intra_vendor_rates"]], lcr_n)
-            lcr_vendor = calculate_lcr_cost([rate for rate, _ in data["vendor_rates"]], lcr_n)
-
-            # Capture file names for each rate category from LCR calculations
-            inter_vendor_file = data["inter_vendor_rates"][lcr_n - 1][1] if len(data["inter_vendor_rates"]) >= lcr_n else ""
-            intra_vendor_file = data["intra_vendor_rates"][lcr_n - 1][1] if len(data["intra_vendor_rates"]) >= lcr_n else ""
-            vendor_file = data["vendor_rates"][lcr_n - 1][1] if len(data["vendor_rates"]) >= lcr_n else ""
-
-            results.append([
-                prefix,
-                data["description"],
-                f"{avg_inter_vendor:.{decimal_places}f}",
-                f"{avg_intra_vendor:.{decimal_places}f}",
-                f"{avg_vendor:.{decimal_places}f}",
-                f"{lcr_inter_vendor:.{decimal_places}f}",
-                f"{lcr_intra_vendor:.{decimal_places}f}",
-                f"{lcr_vendor:.{decimal_places}f}",
-                data["currency"],
-                data["billing_scheme"],
-                inter_vendor_file,  # Source file for inter-vendor rate
-                intra_vendor_file,  # Source file for intra-vendor rate
-                vendor_file         # Source file for vendor rate
-            ])
-
     # Create DataFrame for main results
     columns = [
         "Prefix", "Description",
@@ -242,7 +131,14 @@ if st.button("Execute"):
         "Intra Vendor Source File",
         "Vendor Source File"
     ]
-    df_main = pd.DataFrame(results, columns=columns)
+    table = lcr_results(rate_deck, lcr_n) if selected_vendor else lcr_results(rate_deck, lcr_n).iloc[:0]
+    rates = [table[f"{metric}_{rate_type}"] for metric in ("average", "lcr") for rate_type in RATE_TYPES]
+    df_main = pd.DataFrame(dict(zip(columns, [
+        table["prefix"], table["description"],
+        *[values.map(f"{{:.{decimal_places}f}}".format) for values in rates],
+        table["currency"], table["billing_scheme"],
+        *[""] * len(RATE_TYPES)  # Source files are not tracked here
+    ])))
 
     # Define columns for high-rate prefixes DataFrame
     high_rate_columns = columns
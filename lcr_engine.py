@@ -0,0 +1,263 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES
+
+# --- Grouped Kernels ---
+
+def round_rates(values, decimals=6):
+    """Rounds an array exactly like the builtin round().
+
+    np.round scales by 10**decimals first, which can tip values sitting on a
+    rounding boundary the other way, so those few are redone with round().
+    """
+    rounded = np.round(values, decimals)
+    scaled = values * 10.0 ** decimals
+    boundary = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    rounded[boundary] = [round(value, decimals) for value in values[boundary].tolist()]
+    return rounded
+
+def average_rates(group_ids, rates, group_count):
+    """Averages the non-negative rates of every group, as calculate_average_rate does.
+
+    Rates are summed in row order so the result matches sum() bit for bit.
+    """
+    valid = rates >= 0.0
+    ids = group_ids[valid]
+    counts = np.bincount(ids, minlength=group_count)
+    sums = np.bincount(ids, weights=rates[valid], minlength=group_count)
+    return mean_rates(sums, counts)
+
+def mean_rates(sums, counts):
+    """Turns per-group sums and counts into rounded averages, 0.0 where a group has no rates."""
+    averages = np.divide(sums, counts, out=np.zeros(len(sums)), where=counts > 0)
+    return round_rates(averages)
+
+def lcr_rates(group_ids, rates, group_count, n):
+    """Picks the n-th cheapest non-negative rate of every group, as calculate_lcr_cost does.
+
+    Groups with fewer than n rates fall back to their most expensive rate and
+    groups without rates to 0.0. Nothing is sorted: the cheapest rate of every
+    group is knocked out n - 1 times with unbuffered scatter reductions, so the
+    cost is O(n * rows).
+
+    Also returns the index of the quote holding each selected rate, or -1. Ties
+    resolve as in a stable sort: the n-th cheapest goes to the earliest of equal
+    rates and the most expensive to the latest.
+    """
+    valid = np.flatnonzero(rates >= 0.0)
+    ids, values = group_ids[valid], rates[valid]
+    counts = np.bincount(ids, minlength=group_count)
+
+    selected = np.zeros(group_count)
+    holders = np.full(group_count, -1, dtype=np.int64)
+    occupied = counts > 0
+    dearest = _group_reduce(np.maximum, ids, values, group_count, -np.inf)
+    last = np.flatnonzero(values == dearest[ids])
+    last = _group_reduce(np.maximum, ids[last], last, group_count, -1)
+    selected[occupied] = dearest[occupied]
+    holders[occupied] = valid[last[occupied]]
+
+    deep = counts >= n
+    if deep.any():
+        rows = np.flatnonzero(deep[ids])
+        ids, remaining = ids[rows], values[rows].copy()
+        for _ in range(n - 1):
+            cheapest = _group_reduce(np.minimum, ids, remaining, group_count, np.inf)
+            remaining[first_rows(ids, remaining == cheapest[ids], group_count)[deep]] = np.inf
+        cheapest = _group_reduce(np.minimum, ids, remaining, group_count, np.inf)
+        first = first_rows(ids, remaining == cheapest[ids], group_count)
+        selected[deep] = cheapest[deep]
+        holders[deep] = valid[rows[first[deep]]]
+    return selected, holders
+
+def _group_reduce(ufunc, group_ids, values, group_count, initial):
+    """Reduces values per group with an unbuffered ufunc.at scatter."""
+    reduced = np.full(group_count, initial)
+    ufunc.at(reduced, group_ids, values)
+    return reduced
+
+def first_rows(group_ids, mask, group_count):
+    """Returns the first row of every group where mask is set, or len(mask) if there is none."""
+    rows = np.flatnonzero(mask)
+    return _group_reduce(np.minimum, group_ids[rows], rows, group_count, len(mask))
+
+def deck_averages(deck, rate_type):
+    """Averages every prefix's rates, from the running totals if the deck is bounded."""
+    totals = deck.rate_totals(rate_type)
+    if totals is None:
+        return average_rates(deck.group_ids(rate_type), deck.rates(rate_type), len(deck))
+    return mean_rates(*totals)
+
+def holder_sources(deck, rate_type, holders):
+    """Returns the source file of each holding quote, or "" where there is none."""
+    names = np.append(deck.sources, "")
+    # A holder of -1 picks the appended -1 and so "", even for a rate type nobody quotes
+    source_ids = np.append(deck.source_ids(rate_type), -1)[holders]
+    return names[source_ids]
+
+def rank_rates(deck, rate_type):
+    """Sorts the non-negative rates of every prefix cheapest first, earlier quotes first among ties.
+
+    Returns (offsets, ranked rates, quote index of each ranked rate) in CSR
+    layout, from which any LCR level can be picked without sorting again.
+    """
+    rates, group_ids = deck.rates(rate_type), deck.group_ids(rate_type)
+    valid = np.flatnonzero(rates >= 0.0)
+    order = valid[np.lexsort((rates[valid], group_ids[valid]))]
+    offsets = np.zeros(len(deck) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(group_ids[valid], minlength=len(deck)), out=offsets[1:])
+    return offsets, rates[order], order
+
+def ranked_lcr_rates(ranks, n):
+    """Picks the n-th cheapest rate of every prefix from rank_rates output, as lcr_rates does."""
+    offsets, ranked, order = ranks
+    counts = np.diff(offsets)
+    occupied = counts > 0
+    picks = (offsets[:-1] + np.minimum(counts, n) - 1)[occupied]
+    selected = np.zeros(len(counts))
+    holders = np.full(len(counts), -1, dtype=np.int64)
+    selected[occupied] = ranked[picks]
+    holders[occupied] = order[picks]
+    return selected, holders
+
+# --- Ranked Metrics ---
+
+def _ranked_picks(ranks, positions):
+    """Gathers the rate and quote index at a per-prefix rank position, 0.0 and -1 where it is out of range."""
+    offsets, ranked, order = ranks
+    counts = np.diff(offsets)
+    inside = (positions >= 0) & (positions < counts)
+    selected = np.zeros(len(counts))
+    holders = np.full(len(counts), -1, dtype=np.int64)
+    selected[inside] = ranked[offsets[:-1][inside] + positions[inside]]
+    holders[inside] = order[offsets[:-1][inside] + positions[inside]]
+    return selected, holders
+
+def _ranked_cheapest_average(ranks, n, skip):
+    """Averages the n cheapest rates after the first skip ones, summed cheapest first like sum(sorted(rates)[:n])."""
+    offsets, ranked, _ = ranks
+    counts = np.clip(np.diff(offsets) - skip, 0, n)
+    sums = np.zeros(len(counts))
+    for k in range(n):
+        rows = np.flatnonzero(counts > k)
+        sums[rows] += ranked[offsets[rows] + skip + k]
+    return mean_rates(sums, counts)
+
+RANKED_METRICS = {
+    "average": lambda deck, rate_type, ranks, n: deck_averages(deck, rate_type),
+    "min": lambda deck, rate_type, ranks, n: ranked_lcr_rates(ranks, 1)[0],
+    "max": lambda deck, rate_type, ranks, n: _ranked_picks(ranks, np.diff(ranks[0]) - 1)[0],
+    "lcr": lambda deck, rate_type, ranks, n: ranked_lcr_rates(ranks, n)[0],
+    "lcr_source": lambda deck, rate_type, ranks, n: holder_sources(deck, rate_type, ranked_lcr_rates(ranks, n)[1]),
+    "cheapest_source": lambda deck, rate_type, ranks, n: holder_sources(deck, rate_type, ranked_lcr_rates(ranks, 1)[1]),
+    "cheapest_average": lambda deck, rate_type, ranks, n: _ranked_cheapest_average(ranks, n, skip=1),
+    "cheapest_average_all": lambda deck, rate_type, ranks, n: _ranked_cheapest_average(ranks, n, skip=0),
+}
+
+# Metrics that take a level, written with the level appended (lcr4, cheapest_average4)
+LEVELLED_METRICS = {"lcr", "lcr_source", "cheapest_average", "cheapest_average_all"}
+
+def parse_metric(metric):
+    """Splits a metric name such as "lcr4" into its RANKED_METRICS key and level (None if it takes none)."""
+    match = re.fullmatch(r"([a-z_]+?)(\d*)", metric)
+    name, level = (match.group(1), match.group(2)) if match else (metric, "")
+    if name not in RANKED_METRICS or (name in LEVELLED_METRICS) != bool(level) or level.startswith("0"):
+        raise ValueError(f"Unknown metric: {metric}")
+    return name, int(level) if level else None
+
+def ranked_metrics(deck, rate_type, ranks, metrics):
+    """Computes a set of metrics of one rate type from a single rank_rates ranking.
+
+    Metrics are named as in RANKED_METRICS, levelled ones with their level
+    appended: "lcr1" to "lcrN" and "lcr_sourceN" (the LCR-N rate and its file),
+    "min", "max", "cheapest_source", "average", "cheapest_averageN" (the N
+    cheapest after the cheapest) and "cheapest_average_allN". Every metric is
+    a gather or an N-step sum over the ranking, so none of them sorts or reads
+    the quotes again; "average" comes from the deck's totals. On a bounded deck
+    the rank metrics only see the quotes the deck kept.
+    """
+    parsed = {metric: parse_metric(metric) for metric in metrics}
+    return {metric: RANKED_METRICS[name](deck, rate_type, ranks, level) for metric, (name, level) in parsed.items()}
+
+def cheapest_averages(deck, rate_type, n, exclude_first_cheapest=True, source_mask=None):
+    """Averages the n cheapest non-negative rates of every prefix in one batch.
+
+    Only quotes from sources flagged in source_mask take part. Rates are
+    ordered by rate, then source label, as sorting (rate, file) tuples does,
+    and the cheapest is dropped first if exclude_first_cheapest is set.
+    Returns the rounded averages (0.0 where no rate is left), the source id of
+    the cheapest averaged rate (-1 where none) and the number of zero rates
+    that passed the filters.
+    """
+    rates, group_ids, source_ids = deck.rates(rate_type), deck.group_ids(rate_type), deck.source_ids(rate_type)
+    kept = rates >= 0.0
+    if source_mask is not None:
+        kept &= source_mask[source_ids]
+    rows = np.flatnonzero(kept)
+    label_ranks = np.argsort(np.argsort(deck.sources, kind="stable"))
+    order = rows[np.lexsort((label_ranks[source_ids[rows]], rates[rows], group_ids[rows]))]
+
+    ids = group_ids[order]
+    ranks = np.arange(len(order)) - np.searchsorted(ids, np.arange(len(deck)))[ids]
+    skip = 1 if exclude_first_cheapest else 0
+    chosen = (ranks >= skip) & (ranks < skip + n)
+    counts = np.bincount(ids[chosen], minlength=len(deck))
+    sums = np.bincount(ids[chosen], weights=rates[order[chosen]], minlength=len(deck))
+
+    cheapest_sources = np.full(len(deck), -1, dtype=np.int64)
+    firsts = ranks == skip
+    cheapest_sources[ids[firsts]] = source_ids[order[firsts]]
+    return mean_rates(sums, counts), cheapest_sources, int((rates[rows] == 0.0).sum())
+
+# --- LCR Table ---
+
+def metrics_table(deck, ranks, metrics):
+    """Lays ranked_metrics of every rate type out per prefix, in columns named "{metric}_{rate_type}"."""
+    table = {"prefix": deck.prefixes}
+    for key in ("description", "currency", "billing_scheme"):
+        table[key] = deck.metadata(key)
+    for rate_type in RATE_TYPES:
+        for metric, values in ranked_metrics(deck, rate_type, ranks[rate_type], metrics).items():
+            table[f"{metric}_{rate_type}"] = values
+    return pd.DataFrame(table)
+
+def lcr_table(deck, lcr_n):
+    """Computes average, LCR-N cost and source of all three rate types for every prefix at once.
+
+    The source is the file holding the LCR-N rate. Prefixes keep the order in
+    which they first appeared in the uploaded files.
+    """
+    group_count = len(deck)
+    table = {"prefix": deck.prefixes}
+    for key in ("description", "currency", "billing_scheme"):
+        table[key] = deck.metadata(key)
+
+    for rate_type in RATE_TYPES:
+        group_ids, rates = deck.group_ids(rate_type), deck.rates(rate_type)
+        lcr, holders = lcr_rates(group_ids, rates, group_count, lcr_n)
+        table[f"average_{rate_type}"] = deck_averages(deck, rate_type)
+        table[f"lcr_{rate_type}"] = lcr
+        table[f"source_{rate_type}"] = holder_sources(deck, rate_type, holders)
+
+    return pd.DataFrame(table)
+
+def ranked_lcr_table(deck, ranks, averages, lcr_n):
+    """Builds the same table as lcr_table from precomputed stages.
+
+    ranks and averages map each rate type to its rank_rates and deck_averages
+    output, so a new LCR level only costs one gather per rate type.
+    """
+    table = {"prefix": deck.prefixes}
+    for key in ("description", "currency", "billing_scheme"):
+        table[key] = deck.metadata(key)
+
+    for rate_type in RATE_TYPES:
+        lcr, holders = ranked_lcr_rates(ranks[rate_type], lcr_n)
+        table[f"average_{rate_type}"] = averages[rate_type]
+        table[f"lcr_{rate_type}"] = lcr
+        table[f"source_{rate_type}"] = holder_sources(deck, rate_type, holders)
+
+    return pd.DataFrame(table)
@@ -0,0 +1,290 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES, CHUNK_ROWS, concat_rate_columns, ingest_vendor_csv
+from rate_deck import METADATA_KEYS, first_codes, stable_group_order
+from lcr_engine import average_rates, lcr_rates, first_rows
+from deck_ingest import vendor_csvs
+
+# --- Settings ---
+
+DEFAULT_SPILL_DIR = os.environ.get("RATEBUILDER_SPILL_DIR", tempfile.gettempdir())
+DEFAULT_MEMORY_BUDGET = int(os.environ.get("RATEBUILDER_SPILL_BUDGET_MB", "1024")) * 2 ** 20
+
+# Rough bytes a CSV row takes while pandas parses it into Python strings
+PARSED_ROW_BYTES = 512
+
+# Bytes a spilled row takes: source id and the three rates
+SPILLED_ROW_BYTES = 4 + 3 * 8
+
+# Working copies the merge makes of every row it holds (concatenation, sort, LCR kernels)
+MERGE_COPIES = 16
+
+# --- Spilling ---
+
+class SpillingDeckBuilder:
+    """Takes typed columns like a deck builder, but spills them to disk as prefix-sorted runs.
+
+    Rows are buffered until they take a quarter of memory_budget, then sorted
+    by prefix, upload order kept within a prefix, and written as a run: a
+    directory of .npy columns that the merge reads back a window at a time.
+    Each run also keeps, per prefix, its first row ordinal and its first
+    non-empty description, currency and billing scheme, so rows without any
+    rate are not written.
+    """
+
+    def __init__(self, directory, memory_budget):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.runs = []
+        self.sources = {}
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._rows = 0
+
+    def add(self, columns, source):
+        source_id = self.sources.setdefault(source, len(self.sources))
+        columns = columns.assign(
+            source_id=np.full(len(columns), source_id, dtype=np.int32),
+            ordinal=self._rows + np.arange(len(columns), dtype=np.int64),
+        )
+        self._rows += len(columns)
+        self._buffer.append(columns)
+        self._buffered_bytes += int(columns.memory_usage(index=False, deep=True).sum())
+        if self._buffered_bytes >= self.memory_budget // 4:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows out as one run."""
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, f"run{len(self.runs):05d}")
+        _write_run(path, concat_rate_columns(self._buffer))
+        self.runs.append(path)
+        self._buffer, self._buffered_bytes = [], 0
+
+def _write_run(path, rows):
+    group_ids, prefixes = pd.factorize(rows["prefix"], sort=False)
+    keys = np.char.encode(np.asarray(prefixes.astype(str), dtype=str), "utf-8")
+    key_order = np.argsort(keys, kind="stable")
+    key_ranks = np.empty(len(keys), dtype=np.int64)
+    key_ranks[key_order] = np.arange(len(keys))
+
+    ordinals = rows["ordinal"].to_numpy()
+    firsts = ordinals[first_rows(group_ids, np.ones(len(rows), dtype=bool), len(keys))]
+    metadata = [first_codes(group_ids, rows[key], len(keys)) for key in METADATA_KEYS]
+
+    rates = np.column_stack([rows[rate_type].to_numpy(dtype="float64") for rate_type in RATE_TYPES])
+    quoted = np.flatnonzero(~np.isnan(rates).all(axis=1))
+    row_ranks = key_ranks[group_ids[quoted]]
+    order = quoted[stable_group_order(row_ranks)]
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_ranks, minlength=len(keys)), out=offsets[1:])
+
+    os.makedirs(path)
+    columns = {
+        "prefixes": keys[key_order],
+        "firsts": firsts[key_order],
+        "metadata": np.column_stack([codes[key_order] for codes, _ in metadata]),
+        "offsets": offsets,
+        "sources": rows["source_id"].to_numpy()[order],
+        "rates": rates[order],
+    }
+    for name, values in columns.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+    with open(os.path.join(path, "labels.pkl"), "wb") as f:
+        pickle.dump([names for _, names in metadata], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+# --- Merging ---
+
+class _Column:
+    """One .npy column of a run, read from disk a slice at a time rather than mapped whole."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            self.shape, _, self.dtype = read_header(f)
+            self.offset = f.tell()
+        self.row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:], dtype=np.int64))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, start, end):
+        count = max(0, end - start)
+        items = count * self.row_bytes // self.dtype.itemsize
+        values = np.fromfile(self.path, self.dtype, items, offset=self.offset + start * self.row_bytes)
+        return values.reshape(count, *self.shape[1:])
+
+class _Run:
+    """Run read front to back from disk, a window of whole prefixes at a time."""
+
+    def __init__(self, path):
+        for name in ("prefixes", "firsts", "metadata", "offsets", "sources", "rates"):
+            setattr(self, name, _Column(os.path.join(path, f"{name}.npy")))
+        with open(os.path.join(path, "labels.pkl"), "rb") as f:
+            self.labels = pickle.load(f)
+        self.size = len(self.prefixes)
+        self.cursor = 0
+
+    def window(self, window_rows):
+        """Reads the prefixes and row offsets of a window of at most window_rows rows, and at least one prefix."""
+        end = min(self.cursor + window_rows, self.size)
+        offsets = self.offsets.read(self.cursor, end + 1)
+        end = self.cursor + max(int(np.searchsorted(offsets, offsets[0] + window_rows, side="right")) - 1, 1)
+        return self.prefixes.read(self.cursor, end), offsets[:end - self.cursor + 1]
+
+    def take(self, count, prefixes, offsets):
+        """Reads the first count prefixes of a window with their rows, and moves the cursor past them."""
+        start, self.cursor = self.cursor, self.cursor + count
+        row_start, row_end = offsets[0], offsets[count]
+        metadata = self.metadata.read(start, self.cursor)
+        return {
+            "prefixes": prefixes[:count],
+            "firsts": self.firsts.read(start, self.cursor),
+            "metadata": [names[metadata[:, k]] for k, names in enumerate(self.labels)],
+            "counts": np.diff(offsets[:count + 1]),
+            "sources": self.sources.read(row_start, row_end),
+            "rates": self.rates.read(row_start, row_end),
+        }
+
+def _merge_runs(runs, window_rows):
+    """Yields lists of run pieces, one per run, that together hold every row of a range of prefixes.
+
+    Every run contributes a window of whole prefixes. The smallest last prefix
+    among windows that stop short of their run's end is the cutoff, so no run
+    still holds a prefix at or below it once the pieces are taken.
+    """
+    while True:
+        active = [run for run in runs if run.cursor < run.size]
+        if not active:
+            return
+        windows = [run.window(window_rows) for run in active]
+        counts = [len(prefixes) for prefixes, _ in windows]
+        bounded = [prefixes[-1] for run, (prefixes, _) in zip(active, windows) if run.cursor + len(prefixes) < run.size]
+        if bounded:
+            cutoff = min(bounded)
+            counts = [int(np.searchsorted(prefixes, cutoff, side="right")) for prefixes, _ in windows]
+        yield [run.take(count, *window) for run, count, window in zip(active, counts, windows)]
+
+def _lcr_block(pieces, source_names, lcr_n):
+    """Computes the lcr_table columns of the prefixes in a set of run pieces, plus their first row ordinal."""
+    keys, inverse = np.unique(np.concatenate([piece["prefixes"] for piece in pieces]), return_inverse=True)
+    group_count = len(keys)
+    piece_ids = np.split(inverse, np.cumsum([len(piece["prefixes"]) for piece in pieces])[:-1])
+
+    first_seen = np.full(group_count, np.iinfo(np.int64).max)
+    np.minimum.at(first_seen, inverse, np.concatenate([piece["firsts"] for piece in pieces]))
+    table = {"first_seen": first_seen, "prefix": np.char.decode(keys, "utf-8").astype(object)}
+
+    # Runs are in upload order, so the first run with a non-empty value holds the first one
+    for k, key in enumerate(METADATA_KEYS):
+        values = np.full(group_count, "", dtype=object)
+        for piece, ids in zip(pieces, piece_ids):
+            labels = piece["metadata"][k]
+            empty = (values[ids] == "") & (labels != "")
+            values[ids[empty]] = labels[empty]
+        table[key] = values
+
+    row_ids = np.concatenate([np.repeat(ids, piece["counts"]) for piece, ids in zip(pieces, piece_ids)])
+    order = stable_group_order(row_ids)
+    row_ids = row_ids[order]
+    sources = np.concatenate([piece["sources"] for piece in pieces])[order]
+    rates = np.concatenate([piece["rates"] for piece in pieces])[order]
+
+    for k, rate_type in enumerate(RATE_TYPES):
+        present = np.flatnonzero(~np.isnan(rates[:, k]))
+        ids, values = row_ids[present], rates[present, k]
+        lcr, holders = lcr_rates(ids, values, group_count, lcr_n)
+        holder_sources = np.append(sources[present], -1)[holders]
+        table[f"average_{rate_type}"] = average_rates(ids, values, group_count)
+        table[f"lcr_{rate_type}"] = lcr
+        table[f"source_{rate_type}"] = source_names[holder_sources]
+    return pd.DataFrame(table)
+
+# --- Spilled Deck ---
+
+class SpilledDeck:
+    """Every quote of an upload, held on disk as prefix-sorted runs instead of in a RateDeck.
+
+    LCR tables are produced by a k-way merge of the runs by prefix, one window
+    of prefixes at a time, so memory stays within memory_budget however large
+    the deck is. The spill directory is removed when the deck is dropped.
+    """
+
+    def __init__(self, spill_dir, runs, sources, memory_budget, high_rates):
+        self._spill_dir = spill_dir
+        self.runs = runs
+        self.sources = np.asarray(sources, dtype=object)
+        self.memory_budget = memory_budget
+        self.high_rates = high_rates
+
+    def lcr_blocks(self, lcr_n):
+        """Yields the lcr_table rows of the deck in prefix order, a merge window at a time.
+
+        Each block carries a first_seen column, the upload-order position of
+        its prefixes' first row.
+        """
+        runs = [_Run(path) for path in self.runs]
+        window_rows = max(1024, self.memory_budget // (MERGE_COPIES * SPILLED_ROW_BYTES * max(len(runs), 1)))
+        source_names = np.append(self.sources, "")
+        for pieces in _merge_runs(runs, window_rows):
+            yield _lcr_block(pieces, source_names, lcr_n)
+
+    def lcr_table(self, lcr_n):
+        """Returns the same table as lcr_engine.lcr_table on the in-memory deck.
+
+        Only the per-prefix results are held in memory, reordered into the
+        prefixes' order of first appearance.
+        """
+        blocks = list(self.lcr_blocks(lcr_n))
+        if not blocks:
+            return _empty_lcr_table()
+        table = pd.concat(blocks, ignore_index=True)
+        order = np.argsort(table["first_seen"].to_numpy(), kind="stable")
+        return table.drop(columns="first_seen").take(order).reset_index(drop=True)
+
+def _empty_lcr_table():
+    columns = ["prefix", *METADATA_KEYS]
+    columns += [f"{measure}_{rate_type}" for rate_type in RATE_TYPES for measure in ("average", "lcr", "source")]
+    return pd.DataFrame({column: [] for column in columns})
+
+# --- Ingest ---
+
+def spill_vendor_files(files, rate_threshold, memory_budget=DEFAULT_MEMORY_BUDGET, directory=DEFAULT_SPILL_DIR):
+    """Ingests vendor CSVs and ZIPs of them into a SpilledDeck, within a memory budget.
+
+    Files are streamed in chunks sized to the budget and spilled as sorted
+    runs. As no deck stays in memory to check thresholds against later, the
+    (file, prefix) pairs whose peak rate is above rate_threshold are collected
+    on the way, in upload order, and counted into each file's summary as
+    high_rate_count. Returns the deck, the sorted vendor names and the
+    per-file summaries.
+    """
+    spill_dir = tempfile.TemporaryDirectory(prefix="ratebuilder_spill_", dir=directory)
+    deck_builder = SpillingDeckBuilder(spill_dir.name, memory_budget)
+    chunk_rows = int(min(CHUNK_ROWS, max(1024, memory_budget // (4 * PARSED_ROW_BYTES))))
+    vendor_names = set()
+    file_summaries = []
+    high_rates = []
+
+    for f, source, label in vendor_csvs(files):
+        names, summary, peaks = ingest_vendor_csv(f, source, deck_builder, chunk_rows)
+        high = peaks[np.fmax.reduce([peaks[rate_type].to_numpy() for rate_type in RATE_TYPES]) > rate_threshold]
+        vendor_names.update(names)
+        file_summaries.append({"filename": label, **summary, "high_rate_count": len(high)})
+        high_rates.append(pd.DataFrame({"prefix": high["prefix"].astype(str).to_numpy(dtype=object), "source": source,
+                                        **{rate_type: high[rate_type].to_numpy() for rate_type in RATE_TYPES}}))
+    deck_builder.flush()
+
+    high_rates = pd.concat(high_rates, ignore_index=True) if high_rates else pd.DataFrame(
+        columns=["prefix", "source", *RATE_TYPES]
+    )
+    deck = SpilledDeck(spill_dir, deck_builder.runs, list(deck_builder.sources), memory_budget, high_rates)
+    return deck, sorted(vendor_names), file_summaries
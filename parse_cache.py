@@ -0,0 +1,137 @@
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from itertools import islice
+
+from rate_ingest import CHUNK_ROWS, PARSER_VERSION, iter_rate_columns, concat_rate_columns
+
+# --- Settings ---
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "RATEBUILDER_PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ratebuilder_parse_cache")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("RATEBUILDER_PARSE_CACHE_MB", "2048")) * 2 ** 20
+
+# Seconds after which an entry still being written counts as left behind by a crashed build
+STALE_SECONDS = 24 * 3600
+
+_SUFFIX = f".v{PARSER_VERSION}.chunks"
+
+# --- Parse Cache ---
+
+class ParseCache:
+    """On-disk cache of parsed vendor CSVs, keyed by a hash of their bytes.
+
+    Each entry is a directory holding the pickled typed columns of one CSV or
+    ZIP member, one file per parsed chunk, so an unchanged deck loads without
+    being decoded or parsed again and never more than a chunk at a time.
+    Directory names carry PARSER_VERSION and entries from other versions are
+    dropped. Once the cache grows past max_bytes the least recently used
+    entries are evicted. The cache holds no open state and can be shipped to
+    worker processes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def iter_rate_columns(self, file, chunk_rows=CHUNK_ROWS):
+        """Yields the typed columns of a vendor CSV in chunks, from the cache if its bytes were parsed before.
+
+        The file is hashed in one streaming pass, then rewound and either
+        replayed from its cached chunks or parsed chunk by chunk, storing every
+        chunk as it goes. A file that cannot be rewound is parsed uncached.
+        """
+        if isinstance(file, bytes):
+            file = io.BytesIO(file)
+        if not file.seekable():
+            yield from iter_rate_columns(file, chunk_rows)
+            return
+        file.seek(0)
+        path = os.path.join(self.directory, f"{content_key(file)}.{chunk_rows}{_SUFFIX}")
+        file.seek(0)
+        if os.path.isdir(path):
+            yield from self._load(path, file, chunk_rows)
+        else:
+            yield from self._store(path, iter_rate_columns(file, chunk_rows))
+
+    def read_rate_columns(self, file):
+        """Returns the typed columns of a whole vendor CSV, through the cache."""
+        return concat_rate_columns(list(self.iter_rate_columns(file)))
+
+    def _load(self, path, file, chunk_rows):
+        """Yields an entry's chunks, parsing the rest of the file instead if one of them is unreadable."""
+        chunk_count = sum(name.endswith(".pkl") for name in os.listdir(path))
+        for number in range(chunk_count):
+            try:
+                with open(os.path.join(path, f"{number}.pkl"), "rb") as f:
+                    columns = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                _remove(path)
+                # Chunks follow from chunk_rows, so parsing resumes exactly where the entry broke off
+                yield from islice(iter_rate_columns(file, chunk_rows), number, None)
+                return
+            yield columns
+        os.utime(path)  # Mark as recently used
+
+    def _store(self, path, chunks):
+        """Yields chunks while pickling each one into a new entry, which only appears once all are written."""
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.directory, suffix=".tmp")
+        try:
+            for number, columns in enumerate(chunks):
+                with open(os.path.join(staging, f"{number}.pkl"), "wb") as f:
+                    pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield columns
+            try:
+                os.rename(staging, path)
+            except OSError:
+                pass  # Another process stored the same bytes first
+        finally:
+            _remove(staging)
+        self._evict()
+
+    def _evict(self):
+        """Drops entries of other parser versions and stale partial ones, then the least recently used beyond max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if stat.st_mtime < time.time() - STALE_SECONDS:
+                        _remove(entry.path)
+                    continue
+                if not entry.name.endswith(_SUFFIX):
+                    _remove(entry.path)
+                    continue
+                size = sum(chunk.stat().st_size for chunk in os.scandir(entry.path))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, size, entry.path))
+
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                _remove(path)
+
+def content_key(file, block_size=1 << 20):
+    """Returns the hex digest that names a file's cache entry, read block by block from where the file stands."""
+    digest = hashlib.blake2b(digest_size=20)
+    while block := file.read(block_size):
+        digest.update(block)
+    return digest.hexdigest()
+
+def _remove(path):
+    """Removes a cache entry or stray file, whichever path is."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
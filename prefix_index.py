@@ -0,0 +1,168 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+
+# --- Settings ---
+
+# Digits a number is padded or cut to before matching; longer prefixes are not indexed
+MAX_DIGITS = 18
+
+# --- Prefix Index ---
+
+class PrefixIndex:
+    """Longest-prefix-match index over the prefixes of an LCR table.
+
+    Numbers are compared as MAX_DIGITS-digit integers, padded with zeros on
+    the right, under which every prefix covers one range of values and the
+    ranges of longer prefixes nest inside those of shorter ones. The nested
+    ranges are flattened once into disjoint intervals, each labelled with the
+    longest prefix covering it, so a lookup is a single binary search over the
+    interval starts. Prefixes that are not all digits, once surrounding
+    whitespace is stripped, cannot match a dialed number and are left out.
+    """
+
+    def __init__(self, prefixes):
+        prefixes = pd.Series(np.asarray(prefixes, dtype=object)).astype(str).str.strip()
+        digits = np.flatnonzero(prefixes.str.fullmatch(r"[0-9]{1,%d}" % MAX_DIGITS).to_numpy(dtype=bool))
+        lengths = prefixes.str.len().to_numpy(dtype=np.int64)[digits]
+        values = prefixes.to_numpy(dtype=str)[digits].astype(np.int64)
+
+        # A 1 in front of the digits keys every prefix apart (44 from 044); a prefix repeated after stripping keeps its first row
+        keys = 10 ** lengths + values
+        order = np.argsort(keys, kind="stable")
+        first = order[_run_starts(keys[order])]
+        keys, lengths, values, indexed = keys[first], lengths[first], values[first], digits[first]
+
+        # The parent of a prefix is its longest indexed truncation
+        parents = np.full(len(keys), -1, dtype=np.int64)
+        for length in range(1, int(lengths.max(initial=1))):
+            longer = np.flatnonzero(lengths > length)
+            truncated = 10 ** length + values[longer] // 10 ** (lengths[longer] - length)
+            at = np.minimum(np.searchsorted(keys, truncated), len(keys) - 1)
+            found = keys[at] == truncated
+            parents[longer[found]] = at[found]
+
+        # Where ranges start, the longest one starting there covers the next interval; where they only end,
+        # the parent of the outermost one ending there does
+        starts = values * 10 ** (MAX_DIGITS - lengths)
+        ends = starts + 10 ** (MAX_DIGITS - lengths)
+        positions = np.sort(np.concatenate([starts, ends]))
+        boundaries = positions[_run_starts(positions)]
+        labels = np.full(len(boundaries), -1, dtype=np.int64)
+        by_end = np.lexsort((lengths, ends))
+        outermost = by_end[_run_starts(ends[by_end])]
+        labels[np.searchsorted(boundaries, ends[outermost])] = parents[outermost]
+        by_start = np.lexsort((-lengths, starts))
+        longest = by_start[_run_starts(starts[by_start])]
+        labels[np.searchsorted(boundaries, starts[longest])] = longest
+
+        self._size = len(prefixes)
+        self._rows = indexed
+        self._lengths = lengths
+        self._parents = parents
+        self._boundaries = boundaries
+        self._labels = labels
+
+        # Plain lists for single lookups, which numpy scalars would slow down
+        self._row_list, self._length_list, self._parent_list = indexed.tolist(), lengths.tolist(), parents.tolist()
+        self._boundary_list, self._label_list = boundaries.tolist(), labels.tolist()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def parent_rows(self):
+        """Returns, for every table row, the row of the longest other indexed prefix its prefix starts with, else -1."""
+        parents = np.full(self._size, -1, dtype=np.int64)
+        nested = self._parents >= 0
+        parents[self._rows[nested]] = self._rows[self._parents[nested]]
+        return parents
+
+    def match(self, number):
+        """Returns the table row of the longest prefix of one dialed number, or -1 if none matches."""
+        number = str(number).strip().lstrip("+")[:MAX_DIGITS]
+        if not (number.isascii() and number.isdecimal()):
+            return -1
+        at = bisect.bisect_right(self._boundary_list, int(number.ljust(MAX_DIGITS, "0"))) - 1
+        label = self._label_list[at] if at >= 0 else -1
+        while label >= 0 and self._length_list[label] > len(number):
+            label = self._parent_list[label]
+        return self._row_list[label] if label >= 0 else -1
+
+    def match_batch(self, numbers):
+        """Returns the table row of the longest matching prefix of every dialed number, -1 where none matches.
+
+        numbers holds digit strings, optionally with a leading "+". Anything
+        else never matches. Digits past MAX_DIGITS are ignored.
+        """
+        return self.match_padded(*_padded_numbers(numbers))
+
+    def match_padded(self, padded, lengths):
+        """Like match_batch, for numbers already padded to MAX_DIGITS digits, given with their digit counts.
+
+        A digit count of 0 marks a number that never matches.
+        """
+        if not len(self._labels):
+            return np.full(len(padded), -1, dtype=np.int64)
+        # Searching in sorted order keeps the binary searches cache-friendly
+        order = np.argsort(padded)
+        at = np.empty(len(padded), dtype=np.int64)
+        at[order] = np.searchsorted(self._boundaries, padded[order], side="right") - 1
+        labels = np.where((at >= 0) & (lengths > 0), self._labels[np.maximum(at, 0)], -1)
+
+        # A number shorter than its matched prefix only matches an enclosing one
+        too_long = np.flatnonzero(labels >= 0)
+        too_long = too_long[self._lengths[labels[too_long]] > lengths[too_long]]
+        while len(too_long):
+            labels[too_long] = self._parents[labels[too_long]]
+            too_long = too_long[labels[too_long] >= 0]
+            too_long = too_long[self._lengths[labels[too_long]] > lengths[too_long]]
+
+        return np.where(labels >= 0, self._rows[np.maximum(labels, 0)], -1)
+
+def _run_starts(values):
+    """Flags the first of every run of equal values in a sorted array."""
+    return np.r_[True, values[1:] != values[:-1]] if len(values) else np.zeros(0, dtype=bool)
+
+def _padded_numbers(numbers, block_rows=1 << 15):
+    """Turns digit strings into MAX_DIGITS-digit integers padded with zeros, and their digit counts (0 if invalid).
+
+    The strings are read as a matrix of code points, a block of rows at a
+    time, so no string is parsed on its own.
+    """
+    numbers = np.char.lstrip(np.char.strip(np.asarray(numbers, dtype=str)), "+").astype(f"U{MAX_DIGITS}")
+    lengths = np.char.str_len(numbers).astype(np.int64)
+    codes = np.ascontiguousarray(numbers).view(np.uint32).reshape(len(numbers), MAX_DIGITS)
+
+    padded = np.zeros(len(numbers), dtype=np.int64)
+    valid = np.zeros(len(numbers), dtype=bool)
+    for start in range(0, len(numbers), block_rows):
+        block = slice(start, start + block_rows)
+        digits = codes[block] - np.uint32(ord("0"))
+        is_digit = digits < 10
+        valid[block] = is_digit.sum(axis=1) == lengths[block]
+        padded[block] = digit_values(np.where(is_digit, digits, 0))
+    return np.where(valid, padded, 0), np.where(valid, lengths, 0)
+
+def digit_values(digits):
+    """Reads the rows of a (numbers, MAX_DIGITS) matrix of digits as integers, most significant digit first.
+
+    The digits become three 6-digit groups with one float64 matrix product,
+    exact below 2**53, so no number is parsed on its own.
+    """
+    groups = (digits.astype(np.float64) @ _GROUP_WEIGHTS).astype(np.int64)
+    return (groups[:, 0] * 10 ** 6 + groups[:, 1]) * 10 ** 6 + groups[:, 2]
+
+# Place value of every digit within its 6-digit group
+_GROUP_WEIGHTS = np.zeros((MAX_DIGITS, 3))
+_GROUP_WEIGHTS[np.arange(MAX_DIGITS), np.arange(MAX_DIGITS) // 6] = 10.0 ** (5 - np.arange(MAX_DIGITS) % 6)
+
+# --- Lookup ---
+
+def lookup_numbers(lcr_results, index, numbers):
+    """Prices dialed numbers against an LCR table: the matched prefix row of each, or blanks where none matches."""
+    numbers = np.asarray(numbers, dtype=str)
+    rows = index.match_batch(numbers)
+    matched = np.flatnonzero(rows >= 0)
+    prices = lcr_results.iloc[rows[matched]].set_axis(matched)
+    return pd.DataFrame({"number": numbers}).join(prices)
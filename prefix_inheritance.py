@@ -0,0 +1,95 @@
+import numpy as np
+
+from rate_ingest import RATE_TYPES
+from prefix_index import PrefixIndex
+
+# --- Prefix Inheritance ---
+
+def inherit_parent_quotes(deck):
+    """Returns a complete deck where vendors quoting a prefix also cover its longer prefixes they do not quote.
+
+    A vendor (its source_vendors name, so files sharing a Vendor name count as
+    one) that quotes 44 but not 447 gets its 44 quotes copied to 447, and on
+    to 4471 unless it quotes 4471 or 447 itself. The parent of a prefix is the
+    longest other prefix of the union deck it starts with, found with a
+    PrefixIndex, and quotes are pushed down the tree one depth at a time, so
+    the work is proportional to the quotes produced rather than to prefixes
+    times vendors. Each rate type inherits on its own: a vendor without an
+    intra rate on 447 takes the intra rate of 44. Inherited quotes keep their
+    source file and follow a prefix's own quotes, so ties go to the vendors
+    quoting the prefix itself.
+    """
+    if any(deck.rate_totals(rate_type) is not None for rate_type in RATE_TYPES):
+        raise ValueError("Prefix inheritance needs the complete deck, not a bounded one")
+
+    parents = PrefixIndex(deck.prefixes).parent_rows()
+    depths = _depths(parents)
+    levels = [np.flatnonzero(depths == depth) for depth in range(1, int(depths.max(initial=0)) + 1)]
+    vendor_ids = np.unique(deck.source_vendors.astype(str), return_inverse=True)[1]
+    return deck.with_quotes({
+        rate_type: _inherited_quotes(deck, rate_type, parents, levels, vendor_ids) for rate_type in RATE_TYPES
+    })
+
+def _depths(parents):
+    """Counts the ancestors of every prefix by walking all parent chains up together."""
+    depths = np.zeros(len(parents), dtype=np.int64)
+    ancestors = parents.copy()
+    while (nested := ancestors >= 0).any():
+        depths += nested
+        ancestors[nested] = parents[ancestors[nested]]
+    return depths
+
+def _inherited_quotes(deck, rate_type, parents, levels, vendor_ids):
+    """Builds the (offsets, rates, source ids) of one rate type with every prefix's inherited quotes appended."""
+    offsets, rates, source_ids = deck.offsets(rate_type), deck.rates(rate_type), deck.source_ids(rate_type)
+    quote_vendors = vendor_ids[source_ids]
+    quoting = _vendor_bits(deck.group_ids(rate_type), quote_vendors, len(deck), int(vendor_ids.max(initial=-1)) + 1)
+    own_counts = np.diff(offsets)
+
+    # The quotes a prefix inherited sit at [inherited_starts, + inherited_counts) of its depth's inherited quotes
+    inherited_starts = np.zeros(len(deck), dtype=np.int64)
+    inherited_counts = np.zeros(len(deck), dtype=np.int64)
+    inherited = [np.zeros(0, dtype=np.int64)]
+    for children in levels:
+        # A child takes its parent's own quotes, then what the parent inherited, both indexing own quotes
+        # followed by the previous depth's inherited quotes
+        parent = parents[children]
+        segment_starts = np.column_stack([offsets[parent], len(rates) + inherited_starts[parent]]).ravel()
+        segment_counts = np.column_stack([own_counts[parent], inherited_counts[parent]]).ravel()
+        quotes = np.concatenate([np.arange(len(rates)), inherited[-1]])[_ragged(segment_starts, segment_counts)]
+        taken = own_counts[parent] + inherited_counts[parent]
+
+        # Vendors quoting the child themselves keep their own quote
+        kept = ~_has_bits(quoting, np.repeat(children, taken), quote_vendors[quotes])
+        inherited.append(quotes[kept])
+        kept_before = np.r_[0, np.cumsum(kept)]
+        ends = np.cumsum(taken)
+        inherited_starts[children] = kept_before[ends - taken]
+        inherited_counts[children] = kept_before[ends] - kept_before[ends - taken]
+
+    # Every prefix lists its own quotes, then its inherited ones
+    new_offsets = np.zeros(len(deck) + 1, dtype=np.int64)
+    np.cumsum(own_counts + inherited_counts, out=new_offsets[1:])
+    new_rates = np.empty(new_offsets[-1], dtype=rates.dtype)
+    new_source_ids = np.empty(new_offsets[-1], dtype=source_ids.dtype)
+    own = np.repeat(new_offsets[:-1] - offsets[:-1], own_counts) + np.arange(len(rates))
+    new_rates[own], new_source_ids[own] = rates, source_ids
+    for children, quotes in zip(levels, inherited[1:]):
+        at = new_offsets[children] + own_counts[children] - inherited_starts[children]
+        placed = np.repeat(at, inherited_counts[children]) + np.arange(len(quotes))
+        new_rates[placed], new_source_ids[placed] = rates[quotes], source_ids[quotes]
+    return new_offsets, new_rates, new_source_ids
+
+def _vendor_bits(group_ids, vendors, size, vendor_count):
+    """Sets bit v of row p of a (size, words) uint64 matrix for every prefix p quoted by vendor v."""
+    bits = np.zeros((size, (vendor_count + 63) // 64), dtype=np.uint64)
+    np.bitwise_or.at(bits, (group_ids, vendors >> 6), np.left_shift(np.uint64(1), (vendors & 63).astype(np.uint64)))
+    return bits
+
+def _has_bits(bits, group_ids, vendors):
+    words = bits[group_ids, vendors >> 6]
+    return (np.right_shift(words, (vendors & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+def _ragged(starts, lengths):
+    """Concatenates the index ranges [start, start + length)."""
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
@@ -0,0 +1,154 @@
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES
+from deck_ingest import ingest_vendor_files, peak_rss
+from parse_cache import ParseCache
+from lcr_engine import rank_rates, deck_averages, ranked_lcr_table
+from out_of_core import spill_vendor_files, DEFAULT_MEMORY_BUDGET
+from prefix_inheritance import inherit_parent_quotes
+
+# --- Result Columns ---
+
+RESULT_COLUMNS = [
+    "Prefix", "Description",
+    "Average Rate (inter, vendor's currency)", "Average Rate (intra, vendor's currency)", "Average Rate (vendor's currency)",
+    "LCR Cost (inter, vendor's currency)", "LCR Cost (intra, vendor's currency)", "LCR Cost (vendor's currency)",
+    "Vendor's currency", "Billing scheme", "Inter Vendor Source File", "Intra Vendor Source File", "Vendor Source File"
+]
+
+# The LCR table column behind every result column
+RESULT_KEYS = [
+    "prefix", "description", *(f"{measure}_{rate_type}" for measure in ("average", "lcr") for rate_type in RATE_TYPES),
+    "currency", "billing_scheme", *(f"source_{rate_type}" for rate_type in RATE_TYPES)
+]
+
+# The average and LCR rate columns, kept as float64
+RATE_COLUMNS = RESULT_COLUMNS[2:8]
+
+# --- Builds ---
+
+def build_rate_deck(files, keep_cheapest=None, workers=1):
+    """Ingests (file, filename) pairs into a RateDeck, returning ingest_vendor_files' results and the peak RSS.
+
+    The peak RSS is peak_rss_by_process of the calling process and the ingest workers.
+    """
+    results = ingest_vendor_files(files, keep_cheapest, workers, parse_cache=ParseCache())
+    return (*results, peak_rss_by_process(results[-1]))
+
+def build_spilled_deck(files, rate_threshold, memory_budget_mb):
+    """Spills (file, filename) pairs into a SpilledDeck, returning spill_vendor_files' results and the peak RSS."""
+    results = spill_vendor_files(files, rate_threshold, memory_budget_mb * 2 ** 20)
+    return (*results, peak_rss_by_process(results[-1]))
+
+def peak_rss_by_process(file_summaries):
+    """Returns the peak RSS in bytes of this process and of the largest ingest worker (0 if none) of a build.
+
+    The process figure is this process's peak since it started, which is the
+    build's own only where the process runs nothing else.
+    """
+    return {
+        "process": peak_rss(),
+        "worker": max((summary.get("worker_peak_rss", 0) for summary in file_summaries), default=0),
+    }
+
+def describe_peak_rss(peaks, process_label):
+    """Words peak_rss_by_process output per process, e.g. "build process 310 MB, largest ingest worker 120 MB"."""
+    described = f"{process_label} {peaks['process'] / 2 ** 20:.0f} MB"
+    if peaks["worker"]:
+        described += f", largest ingest worker {peaks['worker'] / 2 ** 20:.0f} MB"
+    return described
+
+# --- LCR Table ---
+
+def deck_ranks(rate_deck):
+    """Ranks the quotes of every rate type once, for the LCR table and the what-if mode."""
+    return {rate_type: rank_rates(rate_deck, rate_type) for rate_type in RATE_TYPES}
+
+def deck_average_rates(rate_deck):
+    return {rate_type: deck_averages(rate_deck, rate_type) for rate_type in RATE_TYPES}
+
+def deck_lcr_table(rate_deck, lcr_n):
+    """Builds the LCR table of an in-memory deck, as the app's Execute step does."""
+    return ranked_lcr_table(rate_deck, deck_ranks(rate_deck), deck_average_rates(rate_deck), lcr_n)
+
+# --- Result Tables ---
+
+def typed_result_table(lcr_results):
+    """Lays the LCR table out in the result columns with the rates kept as numbers, for display and exports."""
+    return lcr_results[RESULT_KEYS].set_axis(RESULT_COLUMNS, axis=1)
+
+def high_rate_table(prefixes, metadata, rows):
+    """Lays the (file, prefix) pairs above the high-rate threshold out in the result columns.
+
+    rows holds the prefix_id, source and peak rates of each pair. prefixes and
+    the description, currency and billing_scheme arrays in metadata are indexed
+    by prefix id. Pairs have no LCR cost, so those columns are NaN.
+    """
+    prefix_ids = rows["prefix_id"].to_numpy()
+    return pd.DataFrame({
+        column: values for column, values in zip(RESULT_COLUMNS, [
+            prefixes[prefix_ids], metadata["description"][prefix_ids],
+            rows["inter_vendor_rates"], rows["intra_vendor_rates"], rows["vendor_rates"],
+            np.nan, np.nan, np.nan, metadata["currency"][prefix_ids], metadata["billing_scheme"][prefix_ids],
+            rows["source"], rows["source"], rows["source"]
+        ])
+    })
+
+def deck_high_rate_table(rate_deck, high_rates, rate_threshold):
+    metadata = {key: rate_deck.metadata(key) for key in ("description", "currency", "billing_scheme")}
+    return high_rate_table(rate_deck.prefixes, metadata, high_rates.rows(rate_threshold))
+
+def spilled_high_rate_table(lcr_results, high_rates):
+    """Lays out the high-rate pairs collected while spilling, with metadata from the merged LCR table."""
+    prefix_ids = pd.Index(lcr_results["prefix"]).get_indexer(high_rates["prefix"])
+    metadata = {key: lcr_results[key].to_numpy() for key in ("description", "currency", "billing_scheme")}
+    return high_rate_table(lcr_results["prefix"].to_numpy(), metadata, high_rates.assign(prefix_id=prefix_ids))
+
+# --- Batch Build ---
+
+# Stages of build_outputs, in the order they run
+BUILD_STAGES = ["ingest", "prefix inheritance", "lcr table", "export"]
+
+def build_outputs(files, lcr_n=4, rate_threshold=1.0, low_memory=False, out_of_core=False, inherit_prefixes=False,
+                  workers=1, memory_budget_mb=DEFAULT_MEMORY_BUDGET // 2 ** 20,
+                  stage=lambda name: nullcontext()):
+    """Runs the app's build and Execute step on (file, filename) pairs without the UI.
+
+    Every stage of BUILD_STAGES that runs is wrapped in the context manager
+    stage(name) returns, for timings or progress. Returns a dict with the LCR
+    table (lcr_results), its typed result table (result_table), the
+    high-rate table, the vendor names, the file summaries with their
+    high-rate counts and the peak RSS of the ingest.
+    """
+    with stage("ingest"):
+        if out_of_core:
+            deck, vendor_names, file_summaries, build_peak_rss = build_spilled_deck(
+                files, rate_threshold, memory_budget_mb
+            )
+            high_rate_counts = [summary["high_rate_count"] for summary in file_summaries]
+        else:
+            deck, vendor_names, high_rates, file_summaries, build_peak_rss = build_rate_deck(
+                files, keep_cheapest=lcr_n if low_memory else None, workers=workers
+            )
+            high_rate_counts = high_rates.file_counts(rate_threshold)
+    if inherit_prefixes:
+        with stage("prefix inheritance"):
+            deck = inherit_parent_quotes(deck)
+    with stage("lcr table"):
+        lcr_results = deck.lcr_table(lcr_n) if out_of_core else deck_lcr_table(deck, lcr_n)
+    with stage("export"):
+        result_table = typed_result_table(lcr_results)
+        if out_of_core:
+            high_rate_results = spilled_high_rate_table(lcr_results, deck.high_rates)
+        else:
+            high_rate_results = deck_high_rate_table(deck, high_rates, rate_threshold)
+    return {
+        "lcr_results": lcr_results, "result_table": result_table, "high_rate_table": high_rate_results,
+        "vendor_names": vendor_names, "peak_rss": build_peak_rss,
+        "file_summaries": [
+            {**summary, "high_rate_count": int(count)} for summary, count in zip(file_summaries, high_rate_counts)
+        ],
+    }
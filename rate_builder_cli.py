@@ -0,0 +1,123 @@
+import argparse
+import gzip
+import os
+import sys
+import time
+import zipfile
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from out_of_core import DEFAULT_MEMORY_BUDGET
+from rate_build import build_outputs, describe_peak_rss
+from result_export import write_csv, write_columnar
+
+# --- Exit Codes ---
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2  # what argparse exits with on bad arguments
+EXIT_NO_INPUT = 3
+
+# --- Inputs ---
+
+def input_files(paths):
+    """Expands the command-line paths into the vendor CSVs and ZIPs to build from, in the order given.
+
+    A directory contributes its own .csv and .zip files, sorted by name, the
+    way an upload of all of them would. Other paths are taken as they are.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith((".csv", ".zip")) and os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            files.append(path)
+    return files
+
+def write_output(table, path, final_decimal_places):
+    """Writes a result table in the format its path names: .parquet, .arrow or .feather, CSV gzipped if .gz, else CSV."""
+    if path.endswith(".parquet"):
+        write_columnar(table, path, "parquet", final_decimal_places)
+    elif path.endswith((".arrow", ".feather")):
+        write_columnar(table, path, "arrow", final_decimal_places)
+    else:
+        with gzip.open(path, "wb", compresslevel=6) if path.endswith(".gz") else open(path, "wb") as output:
+            write_csv(table, output, final_decimal_places)
+
+# --- Timings ---
+
+@contextmanager
+def timed(stage):
+    """Prints how long a stage took to stderr, so stdout stays free for scripting."""
+    started = time.perf_counter()
+    yield
+    print(f"{stage}: {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+# --- Command Line ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Builds the LCR deck from vendor CSVs and ZIPs without the Streamlit UI."
+    )
+    parser.add_argument("inputs", nargs="+", help="vendor CSVs, ZIPs of them, or directories holding them")
+    parser.add_argument("-o", "--output", required=True, help=(
+        "path of the main LCR results: .parquet, .arrow or .feather for typed columns, else CSV, gzipped if .gz"
+    ))
+    parser.add_argument("--high-rates-output", help="path of the high-rate prefixes, same formats (not written if omitted)")
+    parser.add_argument("--lcr-n", type=int, default=4, help="LCR level, e.g. 4 for LCR4 (default 4)")
+    parser.add_argument("--threshold", type=float, default=1.0, help="high-rate threshold (default 1.0)")
+    parser.add_argument("--final-decimals", type=int, default=6, help="decimal places of the export (default 6)")
+    parser.add_argument("--workers", type=int, default=1, help="ingest worker processes (default 1)")
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument("--low-memory", action="store_true", help="keep only the LCR-level cheapest quotes per prefix")
+    modes.add_argument("--out-of-core", action="store_true", help="spill sorted runs to disk for decks larger than memory")
+    modes.add_argument("--inherit-prefixes", action="store_true",
+                       help="let a vendor quoting a prefix cover the longer prefixes it does not quote")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET // 2 ** 20,
+                        help="out-of-core memory budget in MB")
+    args = parser.parse_args(argv)
+    if args.lcr_n < 1 or args.workers < 1 or args.final_decimals < 0 or args.memory_budget_mb < 64:
+        parser.error("--lcr-n and --workers must be at least 1, --final-decimals at least 0 and --memory-budget-mb at least 64")
+    return args
+
+def run(args):
+    """Runs the app's build and Execute step on the inputs and writes the CSVs, returning an exit code."""
+    paths = input_files(args.inputs)
+    if not paths:
+        print("No vendor CSVs or ZIPs found", file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    with ExitStack() as stack:
+        files = [(stack.enter_context(open(path, "rb")), os.path.basename(path)) for path in paths]
+        outputs = build_outputs(
+            files, lcr_n=args.lcr_n, rate_threshold=args.threshold,
+            low_memory=args.low_memory, out_of_core=args.out_of_core, inherit_prefixes=args.inherit_prefixes,
+            workers=args.workers, memory_budget_mb=args.memory_budget_mb, stage=timed
+        )
+    if not outputs["file_summaries"]:
+        print("No vendor CSVs found in the inputs", file=sys.stderr)
+        return EXIT_NO_INPUT
+    print(f"Files: {len(outputs['file_summaries'])}, vendors: {len(outputs['vendor_names'])}, "
+          f"peak memory: {describe_peak_rss(outputs['peak_rss'], 'build process')}", file=sys.stderr)
+
+    with timed("write"):
+        write_output(outputs["result_table"], args.output, args.final_decimals)
+        if args.high_rates_output:
+            write_output(outputs["high_rate_table"], args.high_rates_output, args.final_decimals)
+    print(f"Total Prefixes Processed: {len(outputs['lcr_results'])}", file=sys.stderr)
+    return EXIT_OK
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return run(args)
+    # pandas' ParserError and EmptyDataError are ValueErrors; corrupt archives and members raise BadZipFile or zlib.error
+    except (OSError, ValueError, zipfile.BadZipFile, zlib.error) as e:
+        print(f"Build failed: {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES, concat_rate_columns
+from lcr_engine import first_rows
+
+METADATA_KEYS = ("description", "currency", "billing_scheme")
+
+# --- Rate Deck ---
+
+class RateDeck:
+    """Read-only store of every vendor quote, grouped by prefix in CSR layout.
+
+    Prefixes and source files are interned to integer ids. For each rate type the
+    quotes of prefix i live in rates[offsets[i]:offsets[i + 1]], in upload order,
+    with the id of the file they came from alongside. Description, currency and
+    billing scheme are stored once per prefix as dictionary codes.
+
+    A bounded deck only holds the cheapest quotes of every prefix, cheapest
+    first, along with the sum and count of all its non-negative rates.
+    """
+
+    def __init__(self, prefixes, sources, source_vendors, metadata, quotes, totals=None):
+        self._prefixes = _frozen(np.asarray(prefixes, dtype=object))
+        self._sources = _frozen(np.asarray(sources, dtype=object))
+        self._source_vendors = _frozen(np.asarray(source_vendors, dtype=object))
+        self._metadata = {key: (_frozen(codes), _frozen(names)) for key, (codes, names) in metadata.items()}
+        self._quotes = {
+            rate_type: tuple(_frozen(array) for array in arrays) for rate_type, arrays in quotes.items()
+        }
+        self._totals = None if totals is None else {
+            rate_type: tuple(_frozen(array) for array in arrays) for rate_type, arrays in totals.items()
+        }
+        self._index = None
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key != "_index"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index = None
+
+    @property
+    def prefixes(self):
+        return self._prefixes
+
+    @property
+    def sources(self):
+        """Source file labels, indexed by source id."""
+        return self._sources
+
+    @property
+    def source_vendors(self):
+        """Vendor name of every source: its Vendor column, or the file label if that is empty."""
+        return self._source_vendors
+
+    def offsets(self, rate_type):
+        return self._quotes[rate_type][0]
+
+    def rates(self, rate_type):
+        return self._quotes[rate_type][1]
+
+    def source_ids(self, rate_type):
+        return self._quotes[rate_type][2]
+
+    def rate_totals(self, rate_type):
+        """Returns (sums, counts) of the non-negative rates of every prefix, or None if the deck is complete."""
+        return None if self._totals is None else self._totals[rate_type]
+
+    def quote_counts(self, rate_type):
+        return np.diff(self.offsets(rate_type))
+
+    def group_ids(self, rate_type):
+        """Returns the prefix id of every quote of a rate type."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.quote_counts(rate_type))
+
+    def metadata(self, key):
+        """Returns one of description, currency or billing_scheme for every prefix."""
+        codes, names = self._metadata[key]
+        return names[codes]
+
+    def prefix_id(self, prefix):
+        """Returns the id of a prefix, raising KeyError if the deck does not quote it."""
+        if self._index is None:
+            self._index = pd.Index(self._prefixes)
+        return self._index.get_loc(prefix)
+
+    def quotes(self, prefix, rate_type):
+        """Returns the (rate, source file) quotes of one prefix in upload order, or cheapest first if bounded."""
+        start, end = self.offsets(rate_type)[self.prefix_id(prefix) + np.arange(2)]
+        sources = self._sources[self.source_ids(rate_type)[start:end]]
+        return list(zip(self.rates(rate_type)[start:end].tolist(), sources))
+
+    def with_quotes(self, quotes):
+        """Returns a complete deck with the same prefixes, sources and metadata but other (offsets, rates, source ids) quotes."""
+        return RateDeck(self._prefixes, self._sources, self._source_vendors, self._metadata, quotes)
+
+    @property
+    def nbytes(self):
+        arrays = [*(array for arrays in self._quotes.values() for array in arrays)]
+        arrays += [codes for codes, _ in self._metadata.values()]
+        return sum(array.nbytes for array in arrays) + 8 * len(self._prefixes)
+
+def _frozen(array):
+    array = np.asarray(array)
+    array.flags.writeable = False
+    return array
+
+# --- Building ---
+
+class RateDeckBuilder:
+    """Collects the typed columns of every file and builds a complete RateDeck."""
+
+    def __init__(self):
+        self.rate_frames = []
+
+    def add(self, columns, source):
+        self.rate_frames.append(columns.assign(source=pd.Categorical([source] * len(columns))))
+
+    def merge(self, other):
+        """Appends the files collected by another builder after this one's."""
+        self.rate_frames.extend(other.rate_frames)
+
+    def build(self):
+        return build_rate_deck(self.rate_frames)
+
+class BoundedDeckBuilder:
+    """Folds typed columns into a bounded RateDeck holding the n cheapest quotes per prefix.
+
+    Memory is O(prefixes * n) instead of O(rows). The cheapest quotes are kept
+    in an [prefix, n] table ordered by (rate, upload order), so the n-th entry
+    is the quote that actually holds the LCR-n rate. Running sums and counts
+    cover the averages.
+
+    A partial builder (partial=True), made to be merged into another, keeps
+    its valid quotes in order instead of summing them, and the merge replays
+    them into the running sums. The sums then add every quote in upload order,
+    exactly like a serial build, whatever the worker count.
+    """
+
+    def __init__(self, n, partial=False):
+        self.n = n
+        self._logged = {rate_type: [] for rate_type in RATE_TYPES} if partial else None
+        self._prefix_ids = {}
+        self._prefixes = []
+        self._source_ids = {}
+        self._vendors = []
+        self._labels = {key: {"": 0} for key in METADATA_KEYS}
+        self._metadata = {key: np.zeros(0, dtype=np.int32) for key in METADATA_KEYS}
+        self._cheapest = {rate_type: _empty_cheapest(0, n) for rate_type in RATE_TYPES}
+        self._totals = {rate_type: (np.zeros(0), np.zeros(0, dtype=np.int64)) for rate_type in RATE_TYPES}
+        self._rows = 0
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def add(self, columns, source):
+        names = [str(name).strip() for name in pd.unique(columns["vendor"].astype(str))]
+        source_id = self._intern_source(source, next((name for name in names if name), ""))
+
+        group_ids = self._intern_prefixes(columns["prefix"])
+        for key in METADATA_KEYS:
+            self._add_metadata(key, group_ids, columns[key])
+        ordinals = self._rows + np.arange(len(columns))
+        for rate_type in RATE_TYPES:
+            self._add_rates(rate_type, group_ids, columns[rate_type].to_numpy(dtype="float64"), source_id, ordinals)
+        self._rows += len(columns)
+
+    def merge(self, other):
+        """Folds in another bounded builder as if its rows had been added after this one's."""
+        if other.n != self.n:
+            raise ValueError(f"Cannot merge a builder keeping {other.n} quotes into one keeping {self.n}")
+
+        source_ids = np.array(
+            [self._intern_source(source, vendor) for source, vendor in zip(other._source_ids, other._vendors)] + [-1],
+            dtype=np.int32,
+        )
+        size = len(other)
+        group_ids = self._intern_prefixes(other._prefixes)
+        for key in METADATA_KEYS:
+            names = np.array(list(other._labels[key]), dtype=object)
+            self._add_metadata(key, group_ids, names[other._metadata[key][:size]])
+
+        for rate_type in RATE_TYPES:
+            sums, counts = self._totals[rate_type]
+            if other._logged is not None:
+                for ids, rates in other._logged[rate_type]:
+                    self._add_totals(rate_type, group_ids[ids], rates)
+            else:
+                other_sums, other_counts = other._totals[rate_type]
+                sums[group_ids] += other_sums[:size]
+                counts[group_ids] += other_counts[:size]
+
+            rates, sources, ordinals = (array[:size] for array in other._cheapest[rate_type])
+            held = np.isfinite(rates)
+            ids = np.repeat(group_ids, self.n)[held.ravel()]
+            self._merge_cheapest(rate_type, ids, rates[held], source_ids[sources[held]], ordinals[held] + self._rows)
+        self._rows += other._rows
+
+    def _intern_source(self, source, vendor):
+        """Maps a source label to its id, naming it after the first non-empty vendor seen in it."""
+        source_id = self._source_ids.setdefault(source, len(self._source_ids))
+        if source_id == len(self._vendors):
+            self._vendors.append("")
+        if not self._vendors[source_id]:
+            self._vendors[source_id] = vendor
+        return source_id
+
+    def _intern_prefixes(self, prefixes):
+        """Maps prefixes to ids, numbering new ones in order of first appearance."""
+        prefixes = pd.Categorical(prefixes)
+        names = prefixes.categories.astype(str)
+        codes, first = np.unique(prefixes.codes, return_index=True)
+        ids = np.empty(len(names), dtype=np.int64)
+        for code in codes[np.argsort(first)]:
+            ids[code] = self._prefix_ids.setdefault(names[code], len(self._prefix_ids))
+            if ids[code] == len(self._prefixes):
+                self._prefixes.append(names[code])
+        self._grow(len(self._prefixes))
+        return ids[prefixes.codes]
+
+    def _grow(self, size):
+        capacity = len(self._metadata[METADATA_KEYS[0]])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        for key, codes in self._metadata.items():
+            self._metadata[key] = np.concatenate([codes, np.zeros(capacity - len(codes), dtype=np.int32)])
+        for rate_type, cheapest in self._cheapest.items():
+            extra = _empty_cheapest(capacity - len(cheapest[0]), self.n)
+            self._cheapest[rate_type] = tuple(np.concatenate([old, new]) for old, new in zip(cheapest, extra))
+        for rate_type, (sums, counts) in self._totals.items():
+            self._totals[rate_type] = (
+                np.concatenate([sums, np.zeros(capacity - len(sums))]),
+                np.concatenate([counts, np.zeros(capacity - len(counts), dtype=np.int64)]),
+            )
+
+    def _add_metadata(self, key, group_ids, labels):
+        labels = pd.Categorical(labels)
+        names = labels.categories.astype(str)
+        dictionary = self._labels[key]
+        codes = np.array([dictionary.setdefault(name, len(dictionary)) for name in names] + [0], dtype=np.int32)
+        row_codes = codes[labels.codes]
+        stored = self._metadata[key]
+        missing = (row_codes != 0) & (stored[group_ids] == 0)
+        rows = np.flatnonzero(missing)
+        firsts = first_rows(group_ids[rows], np.ones(len(rows), dtype=bool), len(stored))
+        filled = np.flatnonzero(firsts < len(rows))
+        stored[filled] = row_codes[rows[firsts[filled]]]
+
+    def _add_rates(self, rate_type, group_ids, rates, source_id, ordinals):
+        valid = rates >= 0.0
+        ids, rates, ordinals = group_ids[valid], rates[valid], ordinals[valid]
+        if self._logged is not None:
+            self._logged[rate_type].append((ids.astype(np.int32), rates))
+        else:
+            self._add_totals(rate_type, ids, rates)
+        self._merge_cheapest(rate_type, ids, rates, np.full(len(ids), source_id, dtype=np.int32), ordinals)
+
+    def _add_totals(self, rate_type, ids, rates):
+        """Adds rates to the running sums one at a time in order, as sum() over a prefix's rates would."""
+        sums, counts = self._totals[rate_type]
+        np.add.at(sums, ids, rates)
+        counts += np.bincount(ids, minlength=len(counts))
+
+    def _merge_cheapest(self, rate_type, ids, rates, sources, ordinals):
+        """Merges quotes into the cheapest table, keeping the n lowest (rate, ordinal) per prefix."""
+        # Only quotes cheaper than a full prefix's current n-th quote can make the cut
+        cheapest_rates, cheapest_sources, cheapest_ordinals = self._cheapest[rate_type]
+        contender = rates < cheapest_rates[ids, -1]
+        ids, rates, sources, ordinals = ids[contender], rates[contender], sources[contender], ordinals[contender]
+        if not len(ids):
+            return
+
+        touched = np.unique(ids)
+        held = np.isfinite(cheapest_rates[touched])
+        candidate_ids = np.concatenate([np.repeat(touched, self.n)[held.ravel()], ids])
+        candidate_rates = np.concatenate([cheapest_rates[touched][held], rates])
+        candidate_sources = np.concatenate([cheapest_sources[touched][held], sources])
+        candidate_ordinals = np.concatenate([cheapest_ordinals[touched][held], ordinals])
+
+        order = np.lexsort((candidate_ordinals, candidate_rates, candidate_ids))
+        sorted_ids = candidate_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        kept = ranks < self.n
+
+        cheapest_rates[touched] = np.inf
+        cheapest_sources[touched] = -1
+        cheapest_ordinals[touched] = -1
+        slots = (sorted_ids[kept], ranks[kept])
+        cheapest_rates[slots] = candidate_rates[order][kept]
+        cheapest_sources[slots] = candidate_sources[order][kept]
+        cheapest_ordinals[slots] = candidate_ordinals[order][kept]
+
+    def build(self):
+        size = len(self._prefixes)
+        sources = np.array(list(self._source_ids), dtype=object)
+        vendors = np.array(self._vendors, dtype=object)
+        metadata = {}
+        for key, dictionary in self._labels.items():
+            metadata[key] = (self._metadata[key][:size], np.array(list(dictionary), dtype=object))
+
+        quotes, totals = {}, {}
+        for rate_type in RATE_TYPES:
+            cheapest_rates, cheapest_sources, _ = (array[:size] for array in self._cheapest[rate_type])
+            held = np.isfinite(cheapest_rates)
+            offsets = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum(held.sum(axis=1), out=offsets[1:])
+            quotes[rate_type] = (offsets, cheapest_rates[held], cheapest_sources[held].astype(np.int32))
+            sums, counts = self._totals[rate_type]
+            totals[rate_type] = (sums[:size], counts[:size])
+
+        return RateDeck(self._prefixes, sources, np.where(vendors != "", vendors, sources), metadata, quotes, totals)
+
+def _empty_cheapest(size, n):
+    return (
+        np.full((size, n), np.inf),
+        np.full((size, n), -1, dtype=np.int32),
+        np.full((size, n), -1, dtype=np.int64),
+    )
+
+def build_rate_deck(rate_frames):
+    """Builds a RateDeck from the typed columns of each vendor file, in upload order.
+
+    Every frame carries a "source" column naming the file its rows came from.
+    """
+    rows = concat_rate_columns(rate_frames)
+    group_ids, prefixes = pd.factorize(rows["prefix"], sort=False)
+    group_count = len(prefixes)
+
+    sources = pd.Categorical(rows["source"])
+    source_ids = sources.codes.astype(np.int16 if len(sources.categories) < 2 ** 15 else np.int32)
+    source_names = sources.categories.astype(str).to_numpy(dtype=object)
+    source_vendors = _source_vendors(rows["vendor"], source_ids, source_names)
+
+    metadata = {key: first_codes(group_ids, rows[key], group_count) for key in METADATA_KEYS}
+
+    quotes = {}
+    for rate_type in RATE_TYPES:
+        rates = rows[rate_type].to_numpy(dtype="float64")
+        present = np.flatnonzero(~np.isnan(rates))
+        order = present[stable_group_order(group_ids[present])]
+        offsets = np.zeros(group_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group_ids[present], minlength=group_count), out=offsets[1:])
+        quotes[rate_type] = (offsets, rates[order], source_ids[order])
+
+    return RateDeck(prefixes.astype(str), source_names, source_vendors, metadata, quotes)
+
+def stable_group_order(group_ids):
+    """Returns the stable permutation that sorts non-negative ids, using 16-bit radix passes."""
+    order = np.argsort((group_ids & 0xFFFF).astype(np.uint16), kind="stable")
+    shift = 16
+    while len(group_ids) and group_ids.max() >> shift:
+        digits = ((group_ids[order] >> shift) & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(digits, kind="stable")]
+        shift += 16
+    return order
+
+def first_codes(group_ids, labels, group_count):
+    """Returns dictionary codes of the first non-empty label of every group, "" if there is none."""
+    labels = pd.Categorical(labels)
+    names = np.append(labels.categories.astype(str).to_numpy(dtype=object), "")
+    rows = first_rows(group_ids, (names != "")[labels.codes], group_count)
+    codes = np.append(labels.codes, len(names) - 1)[rows]
+    return codes.astype(np.int32), names
+
+def _source_vendors(vendors, source_ids, source_names):
+    """Names each source after the first non-empty Vendor value in it, falling back to its label."""
+    first = first_codes(source_ids, vendors, len(source_names))
+    names = np.array([str(name).strip() for name in first[1]], dtype=object)[first[0]]
+    return np.where(names != "", names, source_names)
@@ -0,0 +1,193 @@
+import codecs
+import io
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# --- Column Layout ---
+
+PREFIX_COLUMN = "Prefix"
+
+# Internal name -> CSV header for the three rate columns
+RATE_COLUMNS = {
+    "inter_vendor_rates": "Rate (inter, vendor's currency)",
+    "intra_vendor_rates": "Rate (intra, vendor's currency)",
+    "vendor_rates": "Rate (vendor's currency)",
+}
+
+# Internal name -> CSV header for the descriptive columns
+TEXT_COLUMNS = {
+    "description": "Description",
+    "currency": "Vendor's currency",
+    "billing_scheme": "Billing scheme",
+    "vendor": "Vendor",
+}
+
+RATE_TYPES = tuple(RATE_COLUMNS)
+
+# Rows parsed at a time when streaming a file
+CHUNK_ROWS = 200_000
+
+# Bytes sampled from the start of a file to pick its encoding
+ENCODING_SAMPLE_BYTES = 1 << 16
+
+# Bump whenever typed_rate_columns changes what it returns, to invalidate cached parses
+PARSER_VERSION = 1
+
+_HEADERS = {PREFIX_COLUMN, *RATE_COLUMNS.values(), *TEXT_COLUMNS.values()}
+
+# --- Functions ---
+
+def read_rate_columns(file, encoding=None, encoding_errors="ignore"):
+    """Parses a vendor CSV straight into typed columns.
+
+    The header is resolved once per file. Text columns come back as categoricals
+    and the rate columns as float64, with NaN where a rate is blank or not numeric.
+    Without an explicit encoding it is detected from the start of the file.
+    """
+    try:
+        frame = _read_csv(file, encoding, encoding_errors)
+    except pd.errors.EmptyDataError:
+        frame = pd.DataFrame({PREFIX_COLUMN: pd.Categorical([])})
+    return typed_rate_columns(frame)
+
+def iter_rate_columns(file, chunk_rows=CHUNK_ROWS, encoding=None, encoding_errors="ignore"):
+    """Like read_rate_columns, but yields the typed columns in chunks of at most chunk_rows rows.
+
+    The file is decoded and parsed incrementally, so memory is bounded by the
+    chunk size rather than the size of the file.
+    """
+    try:
+        chunks = _read_csv(file, encoding, encoding_errors, chunksize=chunk_rows)
+        for frame in chunks:
+            yield typed_rate_columns(frame)
+    except pd.errors.EmptyDataError:
+        return
+
+def _read_csv(file, encoding, encoding_errors, **kwargs):
+    if encoding is None:
+        file, encoding = sniff_encoding(file)
+    return pd.read_csv(
+        file,
+        dtype=object,
+        na_filter=False,
+        usecols=lambda header: header in _HEADERS,
+        encoding=encoding,
+        encoding_errors=encoding_errors,
+        **kwargs,
+    )
+
+def sniff_encoding(file):
+    """Picks the encoding of a binary file from its first ENCODING_SAMPLE_BYTES without consuming them.
+
+    Returns the file to read from, which wraps unseekable streams, and the
+    encoding: UTF-16 if it starts with a UTF-16 byte order mark, UTF-8 (with an
+    optional BOM) if the sample is valid UTF-8, Latin-1 otherwise. Bytes after
+    the sample that do not decode are dropped rather than forcing a second pass.
+    """
+    if file.seekable():
+        start = file.tell()
+        sample = file.read(ENCODING_SAMPLE_BYTES)
+        file.seek(start)
+    else:
+        file = io.BufferedReader(file, ENCODING_SAMPLE_BYTES)
+        sample = file.peek(ENCODING_SAMPLE_BYTES)[:ENCODING_SAMPLE_BYTES]
+    return file, detect_encoding(sample)
+
+def detect_encoding(sample):
+    """Returns the encoding that reads a leading sample of a vendor CSV."""
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8-sig"
+
+def typed_rate_columns(frame):
+    """Converts a raw string frame read from a vendor CSV into typed columns."""
+    if PREFIX_COLUMN not in frame.columns:
+        raise ValueError(f"Missing required '{PREFIX_COLUMN}' column")
+
+    frame = frame.reset_index(drop=True)
+
+    columns = {"prefix": pd.Categorical(frame[PREFIX_COLUMN])}
+    for key, header in TEXT_COLUMNS.items():
+        if header in frame.columns:
+            columns[key] = pd.Categorical(frame[header])
+        else:
+            columns[key] = pd.Categorical([""] * len(frame))
+    for key, header in RATE_COLUMNS.items():
+        columns[key] = _parse_rates(frame[header]) if header in frame.columns else float("nan")
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(frame)))
+
+def _parse_rates(values):
+    """Converts a categorical of rate strings to float64 by parsing each distinct value once."""
+    values = pd.Categorical(values)
+    parsed = pd.to_numeric(pd.Series(values.categories.astype(str)).str.strip(), errors="coerce").to_numpy(dtype="float64")
+    rates = parsed.take(values.codes, mode="clip")
+    rates[values.codes < 0] = float("nan")
+    return rates
+
+def concat_rate_columns(frames):
+    """Stacks the typed columns of several files in order, keeping text columns categorical."""
+    if not frames:
+        return read_rate_columns(io.BytesIO()).assign(source=pd.Categorical([]))
+
+    columns = {}
+    for key in frames[0].columns:
+        if isinstance(frames[0][key].dtype, pd.CategoricalDtype):
+            columns[key] = union_categoricals([pd.Categorical(frame[key]) for frame in frames])
+        else:
+            columns[key] = np.concatenate([frame[key].to_numpy() for frame in frames])
+    return pd.DataFrame(columns)
+
+def high_rate_mask(columns, rate_threshold):
+    """Flags rows where any of the three rates is above the threshold."""
+    return (columns[list(RATE_TYPES)] > rate_threshold).any(axis=1).to_numpy()
+
+def missing_mask(columns):
+    """Flags rows without a prefix or without a vendor rate."""
+    return ((columns["prefix"] == "") | columns["vendor_rates"].isna()).to_numpy()
+
+def peak_rates(columns):
+    """Returns the highest of each rate type for every prefix of one file, in order of first appearance."""
+    columns = columns[["prefix", *RATE_TYPES]].assign(prefix=pd.Categorical(columns["prefix"]))
+    return columns.groupby("prefix", observed=True, sort=False).max().reset_index()
+
+def ingest_vendor_csv(file, source, deck_builder, chunk_rows=CHUNK_ROWS):
+    """Streams one vendor CSV into a deck builder chunk by chunk.
+
+    Returns the vendor names found in the file, its Pre-Execution Summary counts
+    and the peak_rates of the file, from which any high-rate threshold can be
+    checked later.
+    """
+    return ingest_rate_columns(iter_rate_columns(file, chunk_rows), source, deck_builder)
+
+def ingest_rate_columns(chunks, source, deck_builder):
+    """Like ingest_vendor_csv, for one file already parsed into chunks of typed columns."""
+    names, peaks, row_count, missing_count = set(), [], 0, 0
+    for columns in chunks:
+        deck_builder.add(columns, source)
+        names.update(vendor_names(columns))
+        peaks.append(peak_rates(columns))
+        row_count += len(columns)
+        missing_count += int(missing_mask(columns).sum())
+
+    peaks = peak_rates(concat_rate_columns(peaks))
+    summary = {"total_prefix_count": len(peaks), "row_count": row_count, "missing_count": missing_count}
+    return names, summary, peaks
+
+def vendor_names(columns):
+    """Returns the distinct non-empty values of the Vendor column."""
+    names = {str(name).strip() for name in columns["vendor"].unique()}
+    names.discard("")
+    return names
+
+def first_values(columns, key):
+    """Returns the first non-empty value of a text column for each prefix, in order of appearance."""
+    values = columns[key].astype(str)
+    present = values != ""
+    firsts = pd.Series(values[present].to_numpy(), index=columns["prefix"].astype(str)[present].to_numpy())
+    return firsts[~firsts.index.duplicated()]
@@ -0,0 +1,187 @@
+import base64
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rate_build import RESULT_COLUMNS, RATE_COLUMNS
+
+# --- Settings ---
+
+# Exports are written under the app's static folder, which Streamlit serves from disk with enableStaticServing.
+# Behind nginx this is the shared directory its /exports/ location serves.
+DEFAULT_EXPORT_DIR = os.environ.get(
+    "RATEBUILDER_EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+)
+EXPORT_URL = os.environ.get("RATEBUILDER_EXPORT_URL", "app/static/exports")
+
+# Streamlit answers 404 for static files over its MAX_APP_STATIC_FILE_SIZE, so larger exports need nginx
+STATIC_FILE_LIMIT = 200 * 1024 * 1024
+
+# With a secret shared with nginx, exports are linked through nginx's secure_link location instead
+EXPORT_SECRET = os.environ.get("RATEBUILDER_EXPORT_SECRET", "")
+SIGNED_EXPORT_URL = os.environ.get("RATEBUILDER_SIGNED_EXPORT_URL", "/exports")
+
+# Seconds a signed link stays valid, and seconds an export is kept on disk
+LINK_TTL_SECONDS = int(os.environ.get("RATEBUILDER_EXPORT_LINK_TTL", "900"))
+EXPORT_TTL_SECONDS = int(os.environ.get("RATEBUILDER_EXPORT_TTL", "86400"))
+
+# Rows formatted into CSV text, or written as one Parquet row group or Arrow record batch, at a time
+EXPORT_CHUNK_ROWS = int(os.environ.get("RATEBUILDER_EXPORT_CHUNK_ROWS", "100000"))
+
+MAIN_RESULTS = "main_lcr_results"
+HIGH_RATE_RESULTS = "high_rate_prefixes"
+ARCHIVE_NAME = "lcr_results.zip"
+RATED_CDRS = "rated_cdrs.csv"
+
+# zip puts every CSV into one archive, gzip compresses each CSV on its own, csv writes them as they are;
+# parquet and arrow (Arrow IPC, i.e. Feather v2) write one typed file per table
+EXPORT_FORMATS = ["zip", "gzip", "csv", "parquet", "arrow"]
+
+# Text columns dictionary-encoded in columnar exports
+DICTIONARY_COLUMNS = [RESULT_COLUMNS[1], *RESULT_COLUMNS[8:]]
+
+# --- CSV ---
+
+def write_csv(table, file, final_decimal_places, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes a result table as CSV to a binary file, chunk_rows rows at a time.
+
+    Only one chunk's text exists at a time, never the whole CSV as a string.
+    The file is left open.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    for start in range(0, max(len(table), 1), chunk_rows):
+        table.iloc[start:start + chunk_rows].to_csv(
+            text, header=start == 0, index=False, float_format=f"%.{final_decimal_places}f"
+        )
+    text.flush()
+    text.detach()
+
+# --- Columnar ---
+
+def write_columnar(table, path, export_format, final_decimal_places, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes a result table to a Parquet or Arrow IPC file, chunk_rows rows per row group or record batch.
+
+    Every batch is converted from its own slice of the table, so the writer
+    never holds more than one batch beside the table. Rates become float64
+    rounded to final_decimal_places, with blanks as nulls. Descriptions,
+    currencies, billing schemes and vendor source files are dictionary-encoded
+    against one dictionary per column that only grows as new labels turn up,
+    so Arrow IPC writes the new labels as dictionary deltas and readers get
+    categoricals back.
+    """
+    schema = pa.schema([
+        (name, pa.float64() if name in RATE_COLUMNS else
+         pa.dictionary(pa.int32(), pa.string()) if name in DICTIONARY_COLUMNS else pa.string())
+        for name in table.columns
+    ])
+    dictionaries = {name: pd.Index([], dtype=object) for name in table.columns if name in DICTIONARY_COLUMNS}
+
+    def batch(start):
+        arrays = []
+        for name in table.columns:
+            values = table[name].iloc[start:start + chunk_rows]
+            if name in RATE_COLUMNS:
+                rates = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+                arrays.append(pa.array(np.round(rates, final_decimal_places), from_pandas=True))
+            elif name in DICTIONARY_COLUMNS:
+                values = values.astype(object)
+                labels = pd.Index(values.dropna().unique())
+                dictionaries[name] = dictionaries[name].append(labels[~labels.isin(dictionaries[name])])
+                codes = dictionaries[name].get_indexer(values)
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(codes, type=pa.int32(), mask=codes < 0), pa.array(dictionaries[name].astype(str), type=pa.string())
+                ))
+            else:
+                arrays.append(pa.array(values.astype(str).to_numpy(dtype=object), type=pa.string()))
+        return pa.record_batch(arrays, schema=schema)
+
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+        writer = pa.ipc.new_file(path, schema, options=options)
+    with writer:
+        for start in range(0, len(table), chunk_rows):
+            writer.write_batch(batch(start))
+
+# --- Exports ---
+
+def export_results(tables, export_format="zip", final_decimal_places=6, directory=DEFAULT_EXPORT_DIR):
+    """Writes result tables, keyed by file name without extension, into a new directory under directory.
+
+    Every table is streamed chunk by chunk straight to disk, through the
+    compressor for CSVs. Returns the paths of the written files: one ZIP
+    holding every CSV, or one file per table. Exports past
+    EXPORT_TTL_SECONDS are removed first.
+    """
+    export_dir = new_export_dir(directory)
+    if export_format == "zip":
+        path = os.path.join(export_dir, ARCHIVE_NAME)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, table in tables.items():
+                with archive.open(name + ".csv", "w", force_zip64=True) as member:
+                    write_csv(table, member, final_decimal_places)
+        return [path]
+
+    paths = []
+    for name, table in tables.items():
+        if export_format in ("parquet", "arrow"):
+            path = os.path.join(export_dir, f"{name}.{export_format}")
+            write_columnar(table, path, export_format, final_decimal_places)
+        elif export_format == "gzip":
+            path = os.path.join(export_dir, name + ".csv.gz")
+            with gzip.open(path, "wb", compresslevel=6) as output:
+                write_csv(table, output, final_decimal_places)
+        else:
+            path = os.path.join(export_dir, name + ".csv")
+            with open(path, "wb") as output:
+                write_csv(table, output, final_decimal_places)
+        paths.append(path)
+    return paths
+
+def new_export_dir(directory=DEFAULT_EXPORT_DIR):
+    """Makes a fresh directory for one export under directory, removing the exports past EXPORT_TTL_SECONDS first."""
+    os.makedirs(directory, exist_ok=True)
+    remove_expired_exports(directory)
+    return tempfile.mkdtemp(prefix="", dir=directory)
+
+def remove_expired_exports(directory=DEFAULT_EXPORT_DIR, ttl=EXPORT_TTL_SECONDS):
+    """Removes the export directories last written more than ttl seconds ago."""
+    expired = time.time() - ttl
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.stat().st_mtime < expired:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+# --- Links ---
+
+def export_url(path, directory=DEFAULT_EXPORT_DIR):
+    """Returns the link an exported file is downloaded from.
+
+    With EXPORT_SECRET set this is a link to nginx, signed for
+    LINK_TTL_SECONDS the way its secure_link_md5 "$secure_link_expires$uri
+    <secret>" expects. Otherwise Streamlit serves the file from its static
+    folder, at a link relative to the app's page.
+    """
+    relative = Path(path).relative_to(directory).as_posix()
+    if not EXPORT_SECRET:
+        return f"{EXPORT_URL}/{relative}"
+    uri = f"{SIGNED_EXPORT_URL}/{relative}"
+    expires = int(time.time()) + LINK_TTL_SECONDS
+    digest = hashlib.md5(f"{expires}{uri} {EXPORT_SECRET}".encode()).digest()
+    signature = base64.urlsafe_b64encode(digest).decode().rstrip("=")
+    return f"{uri}?md5={signature}&expires={expires}"
+
+def export_too_large(path):
+    """Tells whether an exported file can't be downloaded: without nginx, Streamlit refuses files over STATIC_FILE_LIMIT."""
+    return not EXPORT_SECRET and os.path.getsize(path) > STATIC_FILE_LIMIT
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from rate_build import RATE_COLUMNS
+
+# --- Settings ---
+
+# Rows of a result table sent to the browser at a time
+PAGE_ROWS = int(os.environ.get("RATEBUILDER_PAGE_ROWS", "100"))
+
+# --- Summary ---
+
+def rate_summary(table):
+    """Summarizes every rate column of a result table: how many prefixes have a rate, and its min, mean, median and max."""
+    rates = table[RATE_COLUMNS]
+    return pd.DataFrame({
+        "Prefixes": rates.count(), "Min": rates.min(), "Mean": rates.mean(),
+        "Median": rates.median(), "Max": rates.max(),
+    })
+
+# --- Pages ---
+
+def page_count(table, page_rows=PAGE_ROWS):
+    return max(1, -(-len(table) // page_rows))
+
+def sort_order(table, column, ascending=True):
+    """Returns the row positions of a table sorted on one column, stably and with blanks last."""
+    values = table[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+def result_page(table, order, page, decimal_places, page_rows=PAGE_ROWS):
+    """Returns page (from 0) of a result table taken in order, with the rates rounded to decimal_places.
+
+    Only the page's rows are copied and rounded, so the cost does not grow
+    with the table.
+    """
+    rows = order[page * page_rows:(page + 1) * page_rows]
+    page_table = table.iloc[rows]
+    return page_table.assign(**{
+        column: np.round(page_table[column].to_numpy(dtype=np.float64), decimal_places) for column in RATE_COLUMNS
+    })
@@ -1,39 +1,19 @@
 import streamlit as st
-import csv
-from collections import defaultdict
+import numpy as np
 import pandas as pd
-import zipfile
 import requests
 import io
+from rate_ingest import RATE_TYPES
+from deck_ingest import ingest_vendor_files
+from parse_cache import ParseCache
+from app_cache import cache_deck_build
+from lcr_engine import rank_rates, metrics_table
 
 # --- Functions ---
 
-def calculate_average_rate(rates):
-    rates = [float(rate) for rate in rates if str(rate).strip() and float(rate) >= 0.0]
-    if rates:
-        return round(sum(rates) / len(rates), 6)  # Default to 6 decimal places
-    return 0.0
-
-def calculate_average_of_cheapest(rates, n=4, exclude_first_cheapest=True):
-    rates = sorted([float(rate) for rate in rates if str(rate).strip() and float(rate) >= 0.0])
-    if exclude_first_cheapest and len(rates) > 0:
-        rates = rates[1:]  # Exclude the first cheapest rate
-    if len(rates) >= n:
-        return round(sum(rates[:n]) / n, 6)  # Default to 6 decimal places
-    return calculate_average_rate(rates)
-
+@cache_deck_build
 def process_csv_data(uploaded_files, dropbox_url, gdrive_url):
-    """Processes CSV data from uploaded files or provided links."""
-    prefix_data = defaultdict(lambda: {
-        "inter_vendor_rates": [],
-        "intra_vendor_rates": [],
-        "vendor_rates": [],
-        "description": None,
-        "currency": None,
-        "billing_scheme": None,
-        "cheapest_file": {}  # Initialize cheapest_file as an empty dictionary
-    })
-
+    """Builds the rate deck from uploaded files or provided links and ranks every rate type once."""
     all_files = []
     if uploaded_files:
         all_files.extend([(f, f.name) for f in uploaded_files])
@@ -42,62 +22,21 @@ def process_csv_data(uploaded_files, dropbox_url, gdrive_url):
     if gdrive_url:
         all_files.extend([(download_from_google_drive(gdrive_url)[0], "gdrive_file.zip")])
 
-    for file, filename in all_files:
-        if isinstance(file, io.BytesIO):
-            file_contents = file.getvalue()
-        else:
-            file_contents = file.read()
-
-        if filename.endswith('.zip'):
-            with zipfile.ZipFile(io.BytesIO(file_contents), 'r') as z:
-                for inner_filename in z.namelist():
-                    if inner_filename.endswith('.csv'):
-                        with z.open(inner_filename) as f:
-                            process_file(f, prefix_data, inner_filename)
-        elif filename.endswith('.csv'):
-            process_file(file, prefix_data, filename)
-
-    return prefix_data
-
-def process_file(file, prefix_data, filename):
-    """Processes a single CSV file."""
-    try:
-        file_text = file.read().decode('utf-8')
-    except UnicodeDecodeError:
-        file_text = file.read().decode('latin-1')
-    reader = csv.DictReader(file_text.splitlines())
-    for row in reader:
-        process_row(prefix_data, row, filename)
-
-def process_row(prefix_data, row, filename):
-    """Processes a single row from the CSV file."""
-    prefix = row["Prefix"]
-    data = prefix_data[prefix]
-
-    data["inter_vendor_rates"].append(row.get("Rate (inter, vendor's currency)", ""))
-    data["intra_vendor_rates"].append(row.get("Rate (intra, vendor's currency)", ""))
-    data["vendor_rates"].append(row.get("Rate (vendor's currency)", ""))
-    data["description"] = data.get("description") or row.get("Description")
-    data["currency"] = data.get("currency") or row.get("Vendor's currency")
-    data["billing_scheme"] = data.get("billing_scheme") or row.get("Billing scheme")
-
-    for rate_type in ["inter_vendor", "intra_vendor", "vendor"]:
-        rate_key = f"Rate ({rate_type.replace('_', ', ') if '_' in rate_type else rate_type}, vendor's currency)"
-        current_rate = float(row.get(rate_key, "inf"))
-
-        # Initialize with the first valid numeric rate:
-        if rate_type not in data["cheapest_file"]:
-            data["cheapest_file"][rate_type] = {"rate": current_rate, "file": filename}
-        else:
-            # Compare only if the existing cheapest rate is numeric:
-            try:
-                cheapest_rate = float(data["cheapest_file"][rate_type]["rate"])
-            except (TypeError, ValueError):
-                cheapest_rate = float("inf")
-
-            if current_rate < cheapest_rate:
-                data["cheapest_file"][rate_type] = {"rate": current_rate, "file": filename}
+    rate_deck = ingest_vendor_files(all_files, parse_cache=ParseCache())[0]
+    return rate_deck, {rate_type: rank_rates(rate_deck, rate_type) for rate_type in RATE_TYPES}
 
+def metric_rows(metrics, metric, decimal_places):
+    """Lays one metric of every rate type out in the result columns, next to the cheapest file per rate type."""
+    rates = [[f"{rate:.{decimal_places}f}" for rate in metrics[f"{metric}_{rate_type}"]] for rate_type in RATE_TYPES]
+    cheapest_files = [
+        np.where(metrics[f"cheapest_source_{rate_type}"] != "", metrics[f"cheapest_source_{rate_type}"], None)
+        for rate_type in RATE_TYPES
+    ]
+    return [
+        list(row) for row in zip(
+            metrics["prefix"], metrics["description"], *rates, metrics["currency"], metrics["billing_scheme"], *cheapest_files
+        )
+    ]
 
 def download_from_dropbox(url):
     try:
@@ -135,62 +74,12 @@ decimal_places = st.number_input("Decimal Places for Rates", min_value=0, value=
 
 
 if uploaded_files or dropbox_url or gdrive_url:
-    prefix_data = process_csv_data(uploaded_files, dropbox_url, gdrive_url)
-
-    results = []
-    cheapest_results = []  
-
-    for prefix, data in prefix_data.items():
-        avg_inter_vendor = calculate_average_rate(data["inter_vendor_rates"])
-        avg_intra_vendor = calculate_average_rate(data["intra_vendor_rates"])
-        avg_vendor = calculate_average_rate(data["vendor_rates"])
-
-        avg_inter_vendor = f"{avg_inter_vendor:.{decimal_places}f}"
-        avg_intra_vendor = f"{avg_intra_vendor:.{decimal_places}f}"
-        avg_vendor = f"{avg_vendor:.{decimal_places}f}"
-
-        results.append([
-            prefix,
-            data["description"],
-            avg_inter_vendor,
-            avg_intra_vendor,
-            avg_vendor,
-            data["currency"],
-            data["billing_scheme"],
-            data["cheapest_file"].get("inter_vendor", {}).get("file"),  # Handle potential KeyError
-            data["cheapest_file"].get("intra_vendor", {}).get("file"),
-            data["cheapest_file"].get("vendor", {}).get("file")
-        ])
-
-        # Calculate average cheapest rates:
-        avg_cheapest_inter_vendor = calculate_average_of_cheapest(
-            data["inter_vendor_rates"], num_cheapest, exclude_first_cheapest=True
-        )
-        avg_cheapest_intra_vendor = calculate_average_of_cheapest(
-            data["intra_vendor_rates"], num_cheapest, exclude_first_cheapest=True
-        )
-        avg_cheapest_vendor = calculate_average_of_cheapest(
-            data["vendor_rates"], num_cheapest, exclude_first_cheapest=True
-        )
+    rate_deck, ranks = process_csv_data(uploaded_files, dropbox_url, gdrive_url)
 
-        # Format cheapest rates:
-        avg_cheapest_inter_vendor = f"{avg_cheapest_inter_vendor:.{decimal_places}f}"
-        avg_cheapest_intra_vendor = f"{avg_cheapest_intra_vendor:.{decimal_places}f}"
-        avg_cheapest_vendor = f"{avg_cheapest_vendor:.{decimal_places}f}"
-
-        # Append data to cheapest_results:
-        cheapest_results.append([
-            prefix,
-            data["description"],
-            avg_cheapest_inter_vendor,
-            avg_cheapest_intra_vendor,
-            avg_cheapest_vendor,
-            data["currency"],
-            data["billing_scheme"],
-            data["cheapest_file"].get("inter_vendor", {}).get("file"),
-            data["cheapest_file"].get("intra_vendor", {}).get("file"),
-            data["cheapest_file"].get("vendor", {}).get("file")
-        ])
+    # Every metric comes out of the one ranking per rate type
+    metrics = metrics_table(rate_deck, ranks, ["average", f"cheapest_average{num_cheapest}", "cheapest_source"])
+    results = metric_rows(metrics, "average", decimal_places)
+    cheapest_results = metric_rows(metrics, f"cheapest_average{num_cheapest}", decimal_places)
 
     columns = [
         "Prefix", "Description",
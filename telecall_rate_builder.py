@@ -1,117 +1,204 @@
 import streamlit as st
-import csv
-from collections import defaultdict
+import numpy as np
 import pandas as pd
-import zipfile
 import requests
-import io
+import os
+import uuid
 from PIL import Image
+from rate_ingest import RATE_TYPES
+from deck_ingest import spool_to_disk
+from app_cache import cache_deck_build, upload_fingerprint
+from lcr_engine import ranked_lcr_table
+from what_if import WhatIfDeck
+from out_of_core import DEFAULT_MEMORY_BUDGET
+from prefix_index import PrefixIndex, lookup_numbers
+from cdr_rating import CdrRater, rate_cdr_file, vendor_costs
+from prefix_inheritance import inherit_parent_quotes
+from rate_build import (
+    RESULT_COLUMNS, RATE_COLUMNS, BUILD_STAGES, build_rate_deck, build_spilled_deck, deck_ranks, deck_average_rates,
+    typed_result_table, deck_high_rate_table, spilled_high_rate_table, describe_peak_rss
+)
+from result_view import rate_summary, page_count, sort_order, result_page
+from result_export import (
+    MAIN_RESULTS, HIGH_RATE_RESULTS, RATED_CDRS, EXPORT_FORMATS, export_results, new_export_dir, export_url,
+    export_too_large, STATIC_FILE_LIMIT
+)
+from build_jobs import BuildScheduler, ACTIVE_STATES
 
 # --- Functions ---
 
-def calculate_average_rate(rates):
-    rates = [float(rate) for rate in rates if str(rate).strip() and float(rate) >= 0.0]
-    return round(sum(rates) / len(rates), 6) if rates else 0.0
-
-def calculate_lcr_cost(rates, n):
-    rates = sorted([float(rate) for rate in rates if str(rate).strip() and float(rate) >= 0.0])
-    return rates[n - 1] if len(rates) >= n else (rates[-1] if rates else 0.0)
-
-def prefix_data_factory():
-    return {
-        "inter_vendor_rates": [],
-        "intra_vendor_rates": [],
-        "vendor_rates": [],
-        "description": None,
-        "currency": None,
-        "billing_scheme": None
-    }
-
-@st.cache_data
-def process_csv_data(uploaded_files, gdrive_url, rate_threshold=1.0):
-    prefix_data = defaultdict(prefix_data_factory)
-    vendor_names = set()
-    high_rate_prefixes = []
-    file_summaries = []
+@cache_deck_build
+def process_csv_data(uploaded_files, gdrive_url, keep_cheapest=None, workers=1):
+    all_files = [(f, f.name) for f in uploaded_files]
+    if gdrive_url:
+        all_files.extend((download, "gdrive_file.zip") for download in download_from_google_drive(gdrive_url))
+    return build_rate_deck(all_files, keep_cheapest, workers)
 
+@cache_deck_build
+def spill_csv_data(uploaded_files, gdrive_url, rate_threshold, memory_budget_mb):
     all_files = [(f, f.name) for f in uploaded_files]
     if gdrive_url:
-        all_files.append((download_from_google_drive(gdrive_url)[0], "gdrive_file.zip"))
+        all_files.extend((download, "gdrive_file.zip") for download in download_from_google_drive(gdrive_url))
+    return build_spilled_deck(all_files, rate_threshold, memory_budget_mb)
 
-    for file, filename in all_files:
-        file_contents = file.getvalue() if isinstance(file, io.BytesIO) else file.read()
-        
-        if filename.endswith('.zip'):
-            with zipfile.ZipFile(io.BytesIO(file_contents), 'r') as z:
-                for inner_filename in z.namelist():
-                    if inner_filename.endswith('.csv'):
-                        with z.open(inner_filename) as f:
-                            prefix_count, high_rate_count = set(), [0]
-                            vendor_names.update(process_individual_csv(
-                                f, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count, inner_filename
-                            ))
-                            file_summaries.append({
-                                "filename": inner_filename.replace('.csv', ''),
-                                "total_prefix_count": len(prefix_count),
-                                "high_rate_count": high_rate_count[0]
-                            })
-        elif filename.endswith('.csv'):
-            prefix_count, high_rate_count = set(), [0]
-            vendor_names.update(process_individual_csv(
-                file, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count, filename.replace('.csv', '')
-            ))
-            file_summaries.append({
-                "filename": filename.replace('.csv', ''),
-                "total_prefix_count": len(prefix_count),
-                "high_rate_count": high_rate_count[0]
-            })
-    
-    return prefix_data, sorted(vendor_names), high_rate_prefixes, file_summaries
-
-def process_individual_csv(file, prefix_data, high_rate_prefixes, rate_threshold, prefix_count, high_rate_count, filename):
-    vendor_names = set()
-    file_text = file.read().decode('utf-8', errors='ignore')
-    reader = csv.DictReader(file_text.splitlines())
-
-    for row in reader:
-        vendor_name = row.get("Vendor", "").strip()
-        if vendor_name:
-            vendor_names.add(vendor_name)
-
-        prefix = row["Prefix"]
-        prefix_count.add(prefix)
-        data = prefix_data[prefix]
-        high_rate_found = False
-
-        for rate_key in ["Rate (inter, vendor's currency)", "Rate (intra, vendor's currency)", "Rate (vendor's currency)"]:
-            rate_value = row.get(rate_key, "").strip()
-            if rate_value and float(rate_value) > rate_threshold:
-               high_rate_found = True
-               print("High rate detected for prefix:", prefix)
-        if high_rate_found:
-            high_rate_prefixes.append((prefix, row, filename))
-            high_rate_count[0] += 1
-
-        if row.get("Rate (inter, vendor's currency)"):
-            data["inter_vendor_rates"].append((row.get("Rate (inter, vendor's currency)"), filename))
-        if row.get("Rate (intra, vendor's currency)"):
-            data["intra_vendor_rates"].append((row.get("Rate (intra, vendor's currency)"), filename))
-        if row.get("Rate (vendor's currency)"):
-            data["vendor_rates"].append((row.get("Rate (vendor's currency)"), filename))
-
-        data["description"] = data.get("description") or row.get("Description")
-        data["currency"] = data.get("currency") or row.get("Vendor's currency")
-        data["billing_scheme"] = data.get("billing_scheme") or row.get("Billing scheme")
-
-    return vendor_names
+def memoized_stage(stage, inputs, compute):
+    """Returns a stage's result from session state, computing it again only when one of its inputs changed.
+
+    Objects such as the deck or an earlier stage's result count as unchanged
+    while they are the same object, plain values while they compare equal.
+    """
+    cached = st.session_state.get(stage)
+    if cached is None or not _same_inputs(cached[0], inputs):
+        cached = (inputs, compute())
+        st.session_state[stage] = cached
+    return cached[1]
+
+def _same_inputs(old, new):
+    return len(old) == len(new) and all(
+        a is b or (isinstance(a, (int, float, str)) and type(a) is type(b) and a == b) for a, b in zip(old, new)
+    )
+
+def rate_cdrs(lcr_results, cdr_file, rate_type):
+    """Rates an uploaded CDR file at the LCR rates, writing the rated rows into a new export, which expires like the others."""
+    rated_rows_path = os.path.join(new_export_dir(), RATED_CDRS)
+    with open(rated_rows_path, "wb") as rated_rows:
+        prefix_costs, unpriced, rejected = rate_cdr_file(cdr_file, CdrRater(lcr_results, rate_type), rated_rows)
+    return prefix_costs, rated_rows_path, unpriced, rejected
+
+@st.cache_resource
+def build_scheduler():
+    """The server's one build scheduler, shared by every session."""
+    return BuildScheduler()
+
+def build_owner():
+    """Returns this browser's build owner token.
+
+    The scheduler only shows a job to the owner that submitted it. The token
+    is kept in the URL next to the job id, so a reloaded page reattaches to
+    its own builds while a job id alone reaches nothing.
+    """
+    owner = st.query_params.get("owner") or st.session_state.get("build_owner") or uuid.uuid4().hex
+    st.session_state["build_owner"] = owner
+    return owner
+
+@st.fragment(run_every=1)
+def watch_build_job(job_id, owner):
+    """Shows a job's queue position or stage with a cancel button, polling until it finishes."""
+    status = build_scheduler().status(job_id, owner)
+    if status is None or status["state"] not in ACTIVE_STATES:
+        st.rerun()
+    if status["state"] == "queued":
+        st.info(f"Build queued: position {status['position']} of {status['queued']}")
+    else:
+        stage = status["stage"] or BUILD_STAGES[0]
+        st.progress(BUILD_STAGES.index(stage) / len(BUILD_STAGES), text=f"Building: {stage} ({status['elapsed']:.0f}s)")
+    if st.button("Cancel build"):
+        build_scheduler().cancel(job_id, owner)
+        st.rerun()
+
+def show_build_job(job_id, owner):
+    """Shows a background build: its progress while it runs, then its summary, tables, lookups and downloads."""
+    status = build_scheduler().status(job_id, owner)
+    if status is None:
+        st.warning("This build is no longer available; execute it again.")
+        del st.query_params["job"]
+    elif status["state"] in ACTIVE_STATES:
+        watch_build_job(job_id, owner)
+    elif status["state"] == "failed":
+        st.error(f"Build failed: {status['error']}")
+    elif status["state"] == "cancelled":
+        st.info("Build cancelled.")
+    else:
+        outputs = memoized_stage("job_outputs", (job_id,), lambda: build_scheduler().result(job_id, owner))
+        st.subheader("Pre-Execution Summary")
+        st.caption(f"Peak memory: {describe_peak_rss(outputs['peak_rss'], 'build process')}, "
+                   f"build time: {status['elapsed']:.0f}s")
+        for summary in outputs["file_summaries"]:
+            st.write(f"File: {summary['filename']}")
+            st.write(f" - Total Prefix Count: {summary['total_prefix_count']}")
+            st.write(f" - Prefixes With Rates Above the Threshold: {summary['high_rate_count']}")
+
+        st.subheader("Final Combined Average and LCR Cost Summary (Rates <= Threshold)")
+        st.write(f"Total Prefixes Processed: {len(outputs['result_table'])}")
+        show_result_table(outputs["result_table"], "main", decimal_places)
+        show_lcr_tools(outputs["lcr_results"])
+        st.subheader("Prefixes with Rates Above High-rate Threshold")
+        show_result_table(outputs["high_rate_table"], "high_rates", decimal_places)
+        show_export_links(outputs["exports"])
+
+def show_result_table(table, key, decimal_places):
+    """Shows a typed result table as summary statistics and one page, sorted and rounded on the server.
+
+    Only the visible page is sent to the browser; key keeps the widgets and
+    sort order of each table apart.
+    """
+    st.dataframe(rate_summary(table))
+    sort_box, order_box, page_box = st.columns(3)
+    sort_column = sort_box.selectbox("Sort by", RESULT_COLUMNS, key=f"{key}_sort")
+    ascending = order_box.radio("Order", ["Ascending", "Descending"], horizontal=True, key=f"{key}_order") == "Ascending"
+    pages = page_count(table)
+    page = page_box.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    order = memoized_stage(f"{key}_sort_order", (table, sort_column, ascending),
+                           lambda: sort_order(table, sort_column, ascending))
+    st.dataframe(
+        result_page(table, order, min(page, pages) - 1, decimal_places), hide_index=True,
+        column_config={column: st.column_config.NumberColumn(format=f"%.{decimal_places}f") for column in RATE_COLUMNS}
+    )
+
+def show_lcr_tools(lcr_results):
+    """Offers the number lookup and CDR rating over an LCR table."""
+    # Number lookup: price dialed numbers by their longest matching prefix in the LCR table
+    dialed_numbers = st.text_area("Look up dialed numbers (one per line):").split()
+    if dialed_numbers:
+        prefix_index = memoized_stage("prefix_index", (lcr_results,), lambda: PrefixIndex(lcr_results["prefix"]))
+        st.dataframe(lookup_numbers(lcr_results, prefix_index, dialed_numbers))
+
+    # CDR rating: price last month's calls at the LCR rates before publishing the deck
+    cdr_file = st.file_uploader("Upload CDRs to rate (CSV: number, duration in seconds, timestamp)", type=["csv"], key="cdr_file")
+    if cdr_file:
+        cdr_rate_type = st.selectbox("Rate CDRs at", RATE_TYPES, index=len(RATE_TYPES) - 1)
+        forget_expired_exports("cdr_rating", lambda rating: [rating[1]])
+        prefix_costs, rated_rows_path, unpriced, rejected = memoized_stage(
+            "cdr_rating", (lcr_results, cdr_file.file_id, cdr_rate_type),
+            lambda: rate_cdrs(lcr_results, cdr_file, cdr_rate_type)
+        )
+        st.subheader("CDR Cost at the LCR Rates")
+        st.write(f"Priced calls: {int(prefix_costs['calls'].sum())}, unpriced: {unpriced}, rejected lines: {rejected}")
+        st.dataframe(vendor_costs(prefix_costs))
+        st.dataframe(prefix_costs)
+        show_export_link(rated_rows_path)
+
+def show_export_links(paths):
+    st.subheader("Export")
+    for path in paths:
+        show_export_link(path)
+
+def show_export_link(path):
+    """Links an exported file, which nginx or Streamlit stream from disk instead of sending it through the websocket.
+
+    Signed links are made again on every rerun, so a reloaded page always hands out fresh ones.
+    """
+    name = os.path.basename(path)
+    if not os.path.exists(path):
+        st.warning(f"{name} has expired; execute the build again.")
+    elif export_too_large(path):
+        st.error(f"{name} is {os.path.getsize(path) / 2**20:.0f} MB, over the {STATIC_FILE_LIMIT // 2**20} MB Streamlit "
+                 "serves as a file. Exports this large are downloaded through nginx: set RATEBUILDER_EXPORT_SECRET and "
+                 "open the app through its nginx, or pick a compressed export format.")
+    else:
+        st.markdown(f'<a href="{export_url(path)}" download="{name}">Download {name}</a>', unsafe_allow_html=True)
+
+def forget_expired_exports(stage, paths):
+    """Drops a memoized stage once the TTL cleanup removed any of the files paths(result) lists, so they are written again."""
+    cached = st.session_state.get(stage)
+    if cached is not None and not all(os.path.exists(path) for path in paths(cached[1])):
+        del st.session_state[stage]
 
 def download_from_google_drive(url):
     try:
         response = requests.get(url, stream=True)
         response.raise_for_status()
-        file_data = io.BytesIO(response.content)
-        file_data.seek(0)
-        return [file_data]
+        return [spool_to_disk(response.iter_content(chunk_size=1048576))]
     except requests.exceptions.RequestException as e:
         st.error(f"Error downloading from Google Drive: {e}")
         return []
@@ -133,76 +220,143 @@ lcr_n = st.number_input("LCR Level (e.g., 4 for LCR4)", min_value=1, value=4)
 decimal_places = st.number_input("Decimal Places for Display", min_value=0, value=6)
 final_decimal_places = st.number_input("Decimal Places for Final Export", min_value=0, value=6)
 rate_threshold = st.number_input("Rate Threshold for High Rate Check", min_value=0.01, value=1.0)
+low_memory = st.checkbox(
+    "Low-memory mode (keep only the LCR-level cheapest quotes per prefix; changing the LCR level re-reads the files)"
+)
+workers = st.number_input("Ingest Worker Processes", min_value=1, max_value=os.cpu_count() or 1, value=1)
+out_of_core = st.checkbox(
+    "Out-of-core mode (spill sorted runs to disk for decks larger than memory; changing the threshold re-reads the files)"
+)
+if out_of_core:
+    memory_budget_mb = st.number_input("Out-of-core Memory Budget (MB)", min_value=64, value=DEFAULT_MEMORY_BUDGET // 2 ** 20)
+# Inheritance needs every quote of the deck, so it is only offered for the complete in-memory build
+inherit_prefixes = not low_memory and not out_of_core and st.checkbox(
+    "Prefix inheritance (a vendor quoting 44 also covers 447 unless it quotes 447 itself)"
+)
+# Builds are queued as background jobs with other users' builds and keep running across page reloads.
+# Building in this session instead is the fallback the what-if mode needs, as jobs don't send their deck back.
+in_session = st.checkbox(
+    "Build in this session instead (blocks this page until the build is done; needed for the what-if mode)"
+)
+export_format = st.selectbox(
+    "Export Format (zip puts both CSVs in one archive; parquet and arrow keep the rates as numbers)", EXPORT_FORMATS
+)
 
-if uploaded_files or gdrive_url:
-    prefix_data, vendor_names, high_rate_prefixes, file_summaries = process_csv_data(uploaded_files, gdrive_url, rate_threshold)
+if not in_session:
+    owner = build_owner()
+    job_id = st.query_params.get("job")
+    if (uploaded_files or gdrive_url) and st.button("Execute"):
+        all_files = [(f, f.name) for f in uploaded_files]
+        if gdrive_url:
+            all_files.extend((download, "gdrive_file.zip") for download in download_from_google_drive(gdrive_url))
+        job_id = build_scheduler().submit(owner, all_files, {
+            "lcr_n": lcr_n, "rate_threshold": rate_threshold, "final_decimal_places": final_decimal_places,
+            "export_format": export_format, "low_memory": low_memory,
+            "out_of_core": out_of_core, "inherit_prefixes": inherit_prefixes, "workers": workers,
+            "memory_budget_mb": memory_budget_mb if out_of_core else DEFAULT_MEMORY_BUDGET // 2 ** 20,
+        })
+        st.query_params["job"], st.query_params["owner"] = job_id, owner
+    if job_id:
+        show_build_job(job_id, owner)
+elif uploaded_files or gdrive_url:
+    if out_of_core:
+        spilled_deck, vendor_names, file_summaries, build_peak_rss = spill_csv_data(
+            uploaded_files, gdrive_url, rate_threshold, memory_budget_mb
+        )
+        rate_deck = high_rates = None
+        high_rate_counts = [summary["high_rate_count"] for summary in file_summaries]
+    else:
+        rate_deck, vendor_names, high_rates, file_summaries, build_peak_rss = process_csv_data(
+            uploaded_files, gdrive_url, keep_cheapest=lcr_n if low_memory else None, workers=workers
+        )
+        high_rate_counts = high_rates.file_counts(rate_threshold)
+        if inherit_prefixes:
+            rate_deck = memoized_stage("inherited_deck", (rate_deck,), lambda: inherit_parent_quotes(rate_deck))
     
     st.subheader("Pre-Execution Summary")
-    for summary in file_summaries:
+    # The server process is shared by every session, so only ingest workers measure this build alone
+    st.caption(f"Peak memory: {describe_peak_rss(build_peak_rss, 'app server process since it started')}")
+    for summary, high_rate_count in zip(file_summaries, high_rate_counts):
         st.write(f"File: {summary['filename']}")
         st.write(f" - Total Prefix Count: {summary['total_prefix_count']}")
-        st.write(f" - Rates Above ${rate_threshold}: {summary['high_rate_count']}")
+        st.write(f" - Prefixes With Rates Above ${rate_threshold}: {high_rate_count}")
+
+    if high_rates is not None:
+        counts, edges = memoized_stage("rate_histogram", (high_rates,), high_rates.histogram)
+        st.write("Distribution of the highest rate per file and prefix:")
+        st.bar_chart(pd.Series(counts, index=[f"{edge:.4g}" for edge in edges[:-1]], name="Prefixes"))
         
     selected_vendor = st.selectbox("Select Base Vendor Name (for filtering):", vendor_names)
     
+    # Execute holds for the uploads and settings it was pressed with; changing any of them asks for it again
+    execute_inputs = (
+        [upload_fingerprint(f) for f in uploaded_files], gdrive_url, lcr_n, rate_threshold, low_memory, workers,
+        out_of_core, memory_budget_mb if out_of_core else None, inherit_prefixes, selected_vendor
+    )
     if st.button("Execute"):
-        results = []
-        for prefix, data in prefix_data.items():
-            if selected_vendor:
-                avg_inter_vendor = calculate_average_rate([rate for rate, _ in data["inter_vendor_rates"]])
-                avg_intra_vendor = calculate_average_rate([rate for rate, _ in data["intra_vendor_rates"]])
-                avg_vendor = calculate_average_rate([rate for rate, _ in data["vendor_rates"]])
-
-                lcr_inter_vendor = calculate_lcr_cost([rate for rate, _ in data["inter_vendor_rates"]], lcr_n)
-                lcr_intra_vendor = calculate_lcr_cost([rate for rate, _ in data["intra_vendor_rates"]], lcr_n)
-                lcr_vendor = calculate_lcr_cost([rate for rate, _ in data["vendor_rates"]], lcr_n)
-
-                inter_vendor_file = data["inter_vendor_rates"][lcr_n - 1][1] if len(data["inter_vendor_rates"]) >= lcr_n else ""
-                intra_vendor_file = data["intra_vendor_rates"][lcr_n - 1][1] if len(data["intra_vendor_rates"]) >= lcr_n else ""
-                vendor_file = data["vendor_rates"][lcr_n - 1][1] if len(data["vendor_rates"]) >= lcr_n else ""
-
-                results.append([
-                    prefix, data["description"],
-                    f"{avg_inter_vendor:.{decimal_places}f}",
-                    f"{avg_intra_vendor:.{decimal_places}f}",
-                    f"{avg_vendor:.{decimal_places}f}",
-                    f"{lcr_inter_vendor:.{decimal_places}f}",
-                    f"{lcr_intra_vendor:.{decimal_places}f}",
-                    f"{lcr_vendor:.{decimal_places}f}",
-                    data["currency"], data["billing_scheme"],
-                    inter_vendor_file, intra_vendor_file, vendor_file
-                ])
-
-        columns = [
-            "Prefix", "Description",
-            "Average Rate (inter, vendor's currency)", "Average Rate (intra, vendor's currency)", "Average Rate (vendor's currency)",
-            "LCR Cost (inter, vendor's currency)", "LCR Cost (intra, vendor's currency)", "LCR Cost (vendor's currency)",
-            "Vendor's currency", "Billing scheme", "Inter Vendor Source File", "Intra Vendor Source File", "Vendor Source File"
-        ]
-        df_main = pd.DataFrame(results, columns=columns)
+        st.session_state["executed"] = execute_inputs
+    elif st.session_state.get("executed") != execute_inputs:
+        st.session_state.pop("executed", None)
 
-        st.subheader("Final Combined Average and LCR Cost Summary (Rates <= Threshold)")
-        st.write(f"Total Prefixes Processed: {len(results)}")
-        st.dataframe(df_main)
-        csv_main = df_main.to_csv(index=False, float_format=f"%.{final_decimal_places}f")
-        st.download_button(label="Download Main LCR Results as CSV", data=csv_main, file_name='main_lcr_results.csv', mime='text/csv')
-
-        df_high_rates = pd.DataFrame(
-            [
-                (
-                    prefix, row.get("Description", ""),
-                    row.get("Rate (inter, vendor's currency)", ""),
-                    row.get("Rate (intra, vendor's currency)", ""),
-                    row.get("Rate (vendor's currency)", ""),
-                    "", "", "", row.get("Vendor's currency", ""), row.get("Billing scheme", ""),
-                    filename, filename, filename
+    if "executed" in st.session_state:
+        main_results = pd.DataFrame({column: pd.Series(dtype=np.float64 if column in RATE_COLUMNS else object)
+                                     for column in RESULT_COLUMNS})
+        if out_of_core:
+            # One streaming merge of the spilled runs serves both the main and the high-rate table
+            lcr_results = memoized_stage("lcr_results", (spilled_deck, lcr_n), lambda: spilled_deck.lcr_table(lcr_n))
+        if selected_vendor:
+            if not out_of_core:
+                ranks = memoized_stage("ranks", (rate_deck,), lambda: deck_ranks(rate_deck))
+                averages = memoized_stage("averages", (rate_deck,), lambda: deck_average_rates(rate_deck))
+                lcr_results = memoized_stage(
+                    "lcr_results", (rate_deck, lcr_n), lambda: ranked_lcr_table(rate_deck, ranks, averages, lcr_n)
                 )
-                for prefix, row, filename in high_rate_prefixes
-            ],
-            columns=columns
-        )
+            main_results = memoized_stage("main_results", (lcr_results,), lambda: typed_result_table(lcr_results))
+
+            # What-if: rebuild the LCR table with vendors left out, updating only the prefixes they quote
+            if not low_memory and not out_of_core:
+                excluded_vendors = st.multiselect("What-if: leave out vendors", np.unique(rate_deck.source_vendors.astype(str)))
+                if excluded_vendors:
+                    what_if = memoized_stage("what_if", (rate_deck, lcr_n), lambda: WhatIfDeck(rate_deck, lcr_n, ranks))
+                    what_if.set_enabled(set(what_if.vendors) - set(excluded_vendors))
+                    what_if_results = what_if.table()
+                    changed = (what_if_results[[f"lcr_{rate_type}" for rate_type in RATE_TYPES]] !=
+                               lcr_results[[f"lcr_{rate_type}" for rate_type in RATE_TYPES]]).any(axis=1)
+                    st.write(f"Prefixes whose LCR cost changes without {', '.join(excluded_vendors)}: {int(changed.sum())}")
+                    show_result_table(typed_result_table(what_if_results[changed]), "what_if", decimal_places)
+
+        st.subheader("Final Combined Average and LCR Cost Summary (Rates <= Threshold)")
+        st.write(f"Total Prefixes Processed: {len(main_results)}")
+        show_result_table(main_results, "main", decimal_places)
+
+        if selected_vendor or out_of_core:
+            show_lcr_tools(lcr_results)
+
+        if out_of_core:
+            df_high_rates = memoized_stage(
+                "df_high_rates", (lcr_results, spilled_deck),
+                lambda: spilled_high_rate_table(lcr_results, spilled_deck.high_rates)
+            )
+        else:
+            df_high_rates = memoized_stage(
+                "df_high_rates", (rate_deck, high_rates, rate_threshold),
+                lambda: deck_high_rate_table(rate_deck, high_rates, rate_threshold)
+            )
 
         st.subheader("Prefixes with Rates Above High-rate Threshold")
-        st.dataframe(df_high_rates)
-        csv_high_rates = df_high_rates.to_csv(index=False, float_format=f"%.{final_decimal_places}f")
-        st.download_button(label="Download High-Rate Prefixes as CSV", data=csv_high_rates, file_name='high_rate_prefixes.csv', mime='text/csv')
+        show_result_table(df_high_rates, "high_rates", decimal_places)
+
+        # Exports are written when asked for, and kept until their tables, format or precision change
+        st.subheader("Export")
+        export_inputs = (main_results, df_high_rates, export_format, final_decimal_places)
+        forget_expired_exports("exports", lambda paths: paths)
+        written = st.session_state.get("exports")
+        if (written is not None and _same_inputs(written[0], export_inputs)) or st.button("Write Export Files"):
+            exports = memoized_stage(
+                "exports", export_inputs,
+                lambda: export_results(
+                    {MAIN_RESULTS: main_results, HIGH_RATE_RESULTS: df_high_rates}, export_format, final_decimal_places
+                )
+            )
+            for path in exports:
+                show_export_link(path)
@@ -0,0 +1,41 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADER = (
+    "Prefix,Description,\"Rate (inter, vendor's currency)\",\"Rate (intra, vendor's currency)\","
+    "Rate (vendor's currency),Vendor's currency,Billing scheme"
+)
+
+def vendor_csv(rows, header=HEADER):
+    """Returns a vendor CSV with the given rows as an in-memory upload."""
+    return io.BytesIO("\n".join([header, *rows, ""]).encode())
+
+def random_vendor_files(count=4, prefixes=2000, seed=7):
+    """Vendor files quoting every prefix twice at random 4-decimal rates.
+
+    Averages of eight such rates often sit right on a 6-decimal rounding
+    boundary, where the order they are summed in decides the rounding.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        (vendor_csv([
+            f"{prefix},Zone {prefix},{inter!r},{intra!r},{rate!r},USD,60/60"
+            for prefix, (inter, intra, rate) in zip(np.tile(np.arange(1000, 1000 + prefixes), 2), np.round(rng.random((2 * prefixes, 3)), 4).tolist())
+        ]), f"v{number}.csv")
+        for number in range(count)
+    ]
+
+@pytest.fixture
+def vendor_only_files():
+    """Two vendor files quoting only the vendor rate, so no quote has an inter or intra rate."""
+    header = "Prefix,Description,Rate (vendor's currency),Vendor's currency,Billing scheme"
+    return lambda: [
+        (vendor_csv(["44,UK,0.1,USD,1/1", "447,UK mobile,0.2,USD,1/1"], header), "v1.csv"),
+        (vendor_csv(["44,UK,0.15,USD,1/1"], header), "v2.csv"),
+    ]
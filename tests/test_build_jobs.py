@@ -0,0 +1,34 @@
+import time
+
+from build_jobs import BuildScheduler, ACTIVE_STATES
+
+def wait_for(scheduler, job_id, owner, timeout=120):
+    deadline = time.monotonic() + timeout
+    while scheduler.status(job_id, owner)["state"] in ACTIVE_STATES:
+        assert time.monotonic() < deadline
+        time.sleep(0.2)
+    return scheduler.status(job_id, owner)
+
+def test_jobs_are_scoped_to_their_owner(tmp_path, vendor_only_files):
+    scheduler = BuildScheduler(max_workers=1, directory=str(tmp_path))
+    job_id = scheduler.submit("alice", vendor_only_files(), {"lcr_n": 2})
+    assert scheduler.status(job_id, "bob") is None
+    scheduler.cancel(job_id, "bob")
+
+    assert wait_for(scheduler, job_id, "alice")["state"] == "done"
+    assert scheduler.result(job_id, "bob") is None
+    assert list(scheduler.result(job_id, "alice")["lcr_results"]["lcr_vendor_rates"]) == [0.15, 0.2]
+
+def test_owner_cancels_queued_and_running_jobs(tmp_path, vendor_only_files):
+    scheduler = BuildScheduler(max_workers=1, directory=str(tmp_path))
+    running = scheduler.submit("alice", vendor_only_files(), {"lcr_n": 2})
+    queued = scheduler.submit("alice", vendor_only_files(), {"lcr_n": 2})
+    while scheduler.status(running, "alice")["state"] == "queued":
+        time.sleep(0.05)
+    assert scheduler.status(queued, "alice")["state"] == "queued"
+
+    scheduler.cancel(queued, "alice")
+    scheduler.cancel(running, "alice")
+    assert scheduler.status(queued, "alice")["state"] == "cancelled"
+    assert scheduler.status(running, "alice")["state"] == "cancelled"
+    assert scheduler.result(running, "alice") is None
@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cdr_rating import CdrRater, rate_cdr_file, vendor_costs, RATED_COLUMNS
+
+CDRS = b"""number,duration,timestamp
+44123,61,2024-05-01 10:00
++44712,10,2024-05-01 10:01
+447912,45,2024-05-01 10:02
+1555,0,2024-05-01 10:03
+1666,7,2024-05-01 10:04
+9999,30,2024-05-01 10:05
+123
+"""
+
+def lcr_results():
+    """An LCR table where 4479 has no vendor rate, so its calls fall back to 447."""
+    return pd.DataFrame({
+        "prefix": ["44", "447", "4479", "1"],
+        "description": ["UK", "UK mobile", "UK mobile 9", "US"],
+        "currency": ["USD"] * 4,
+        "billing_scheme": ["60/60", "1/1", "30", ""],
+        "lcr_vendor_rates": [1.2, 0.6, 0.0, 0.3],
+        "source_vendor_rates": ["a", "b", "", "c"],
+    })
+
+@pytest.mark.parametrize("block_bytes", [16, 1 << 20])
+def test_cdr_totals(block_bytes):
+    rated_rows = io.BytesIO()
+    prefix_costs, unpriced, rejected = rate_cdr_file(io.BytesIO(CDRS), CdrRater(lcr_results()), rated_rows, block_bytes)
+    assert (unpriced, rejected) == (1, 1)
+    assert prefix_costs["prefix"].tolist() == ["44", "447", "1"]
+    assert prefix_costs["calls"].tolist() == [1, 2, 2]
+    assert prefix_costs["seconds"].tolist() == [61, 55, 7]
+    assert prefix_costs["billed_seconds"].tolist() == [120, 55, 7]
+    assert np.allclose(prefix_costs["cost"], [2.4, 0.55, 0.035])
+
+    vendors = vendor_costs(prefix_costs)
+    assert vendors["source"].tolist() == ["a", "b", "c"]
+    assert np.isclose(vendors["cost"].sum(), 2.985)
+
+    rated = pd.read_csv(io.BytesIO(rated_rows.getvalue()), dtype=str, keep_default_na=False)
+    assert list(rated.columns[-len(RATED_COLUMNS):]) == list(RATED_COLUMNS)
+    assert len(rated) == CDRS.count(b"\n") - 1
+    assert np.isclose(pd.to_numeric(rated["Cost"], errors="coerce").sum(), 2.985)
@@ -0,0 +1,14 @@
+import numpy as np
+
+from rate_build import build_rate_deck, deck_lcr_table
+from rate_ingest import RATE_TYPES
+from conftest import random_vendor_files
+
+def test_low_memory_averages_match_complete_deck():
+    complete = deck_lcr_table(build_rate_deck(random_vendor_files())[0], 4)
+    assert (complete["average_vendor_rates"] > 0).all()
+    for workers in (1, 3):
+        bounded = deck_lcr_table(build_rate_deck(random_vendor_files(), keep_cheapest=4, workers=workers)[0], 4)
+        for rate_type in RATE_TYPES:
+            assert np.array_equal(bounded[f"average_{rate_type}"], complete[f"average_{rate_type}"])
+        assert bounded.equals(complete)
@@ -0,0 +1,23 @@
+from rate_build import build_rate_deck, deck_ranks, deck_average_rates, deck_lcr_table
+from lcr_engine import lcr_table, ranked_lcr_table, metrics_table
+from what_if import WhatIfDeck
+
+def test_rate_type_without_quotes(vendor_only_files):
+    deck = build_rate_deck(vendor_only_files())[0]
+    assert len(deck.rates("intra_vendor_rates")) == 0
+    ranks = deck_ranks(deck)
+
+    table = lcr_table(deck, 2)
+    assert table.equals(ranked_lcr_table(deck, ranks, deck_average_rates(deck), 2))
+    assert table.equals(deck_lcr_table(deck, 2))
+    assert list(table["source_intra_vendor_rates"]) == ["", ""]
+    assert list(table["lcr_intra_vendor_rates"]) == [0.0, 0.0]
+    assert list(table["source_vendor_rates"]) == ["v2", "v1"]
+    assert list(table["lcr_vendor_rates"]) == [0.15, 0.2]
+
+    metrics = metrics_table(deck, ranks, ["lcr_source2", "cheapest_source"])
+    assert list(metrics["cheapest_source_inter_vendor_rates"]) == ["", ""]
+
+    what_if = WhatIfDeck(deck, 2, ranks)
+    what_if.set_enabled({"v1"})
+    assert list(what_if.table()["source_intra_vendor_rates"]) == ["", ""]
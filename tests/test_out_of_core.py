@@ -0,0 +1,17 @@
+from rate_build import build_rate_deck, build_spilled_deck, deck_lcr_table
+from out_of_core import spill_vendor_files
+from conftest import random_vendor_files
+
+def test_spilled_rate_type_without_quotes(vendor_only_files):
+    spilled = build_spilled_deck(vendor_only_files(), rate_threshold=1.0, memory_budget_mb=64)[0].lcr_table(2)
+    complete = deck_lcr_table(build_rate_deck(vendor_only_files())[0], 2)
+    assert list(spilled["source_intra_vendor_rates"]) == ["", ""]
+    assert spilled[complete.columns].reset_index(drop=True).equals(complete)
+
+def test_spilled_deck_matches_in_memory_build(tmp_path):
+    spilled, _, summaries = spill_vendor_files(random_vendor_files(), 0.9, memory_budget=1 << 20, directory=str(tmp_path))
+    assert len(spilled.runs) > 1
+    assert sum(1 for _ in spilled.lcr_blocks(4)) > 1
+    deck, _, high_rates, _, _ = build_rate_deck(random_vendor_files())
+    assert spilled.lcr_table(4).equals(deck_lcr_table(deck, 4))
+    assert [summary["high_rate_count"] for summary in summaries] == high_rates.file_counts(0.9).tolist()
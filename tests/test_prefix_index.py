@@ -0,0 +1,29 @@
+import numpy as np
+
+from prefix_index import PrefixIndex
+
+def longest_match(prefixes, number):
+    """Brute-force longest prefix match, keeping the first row of a prefix listed twice."""
+    digits = number.strip().lstrip("+")
+    if not (digits.isascii() and digits.isdecimal()):
+        return -1
+    rows = {}
+    for row, prefix in enumerate(prefixes):
+        prefix = prefix.strip()
+        if prefix.isdecimal() and digits.startswith(prefix):
+            rows.setdefault(prefix, row)
+    return rows[max(rows, key=len)] if rows else -1
+
+def test_matches_longest_prefix():
+    rng = np.random.default_rng(5)
+    prefixes = [" 44", "447", "4479", "44", "0044", "1", "12a", "", "3"] + [
+        "".join(rng.choice(list("0123456789"), rng.integers(1, 7))) for _ in range(300)
+    ]
+    numbers = ["+447911", "4", "447", "00441", "12a", "abc", "", " 3 "] + [
+        "".join(rng.choice(list("0123456789"), rng.integers(1, 12))) for _ in range(2000)
+    ]
+    index = PrefixIndex(prefixes)
+    expected = [longest_match(prefixes, number) for number in numbers]
+    assert index.match_batch(numbers).tolist() == expected
+    assert [index.match(number) for number in numbers] == expected
+    assert PrefixIndex(prefixes[:9]).match_batch(["4479", "44", "00449", "12", "+3", "12a"]).tolist() == [2, 0, 4, 5, 8, -1]
@@ -0,0 +1,39 @@
+import numpy as np
+
+from rate_build import build_rate_deck
+from rate_ingest import RATE_TYPES
+from prefix_inheritance import inherit_parent_quotes
+from conftest import vendor_csv
+
+TREE = ["4", "44", "447", "4471", "44712", "449", "1", "12", "129"]
+
+def random_tree_files(count=4, seed=11):
+    """Vendor files quoting TREE, the first all of it and the others a random subset, with some rates left blank."""
+    rng = np.random.default_rng(seed)
+    files = []
+    for number in range(count):
+        rows = []
+        for prefix in rng.permutation(TREE)[:len(TREE) if number == 0 else rng.integers(2, len(TREE))]:
+            rates = [f"{rate:.3f}" if rng.random() < 0.7 else "" for rate in rng.random(3)]
+            rows.append(f"{prefix},Zone {prefix},{','.join(rates)},USD,60/60")
+        files.append((vendor_csv(rows), f"v{number}.csv"))
+    return files
+
+def inherited(deck, prefix, rate_type):
+    """Brute-force inheritance: a prefix's own quotes, then those of its ancestors, nearest first, for vendors not quoting a nearer one."""
+    quotes = list(deck.quotes(prefix, rate_type))
+    blocked = {source for _, source in quotes}
+    ancestor = prefix
+    while ancestor := next((prefix[:length] for length in range(len(ancestor) - 1, 0, -1) if prefix[:length] in deck.prefixes), None):
+        own = deck.quotes(ancestor, rate_type)
+        quotes += [(rate, source) for rate, source in own if source not in blocked]
+        blocked |= {source for _, source in own}
+    return quotes
+
+def test_inherits_nearest_ancestor_quotes():
+    deck = build_rate_deck(random_tree_files())[0]
+    assert set(deck.prefixes) == set(TREE)
+    inheriting = inherit_parent_quotes(deck)
+    for prefix in deck.prefixes:
+        for rate_type in RATE_TYPES:
+            assert inheriting.quotes(prefix, rate_type) == inherited(deck, prefix, rate_type), (prefix, rate_type)
@@ -0,0 +1,41 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from rate_builder_cli import main, EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_NO_INPUT
+from rate_build import RESULT_COLUMNS
+
+@pytest.fixture
+def vendor_dir(tmp_path, vendor_only_files):
+    directory = tmp_path / "vendors"
+    directory.mkdir()
+    for file, name in vendor_only_files():
+        (directory / name).write_bytes(file.getvalue())
+    (directory / "notes.txt").write_text("not a vendor file")
+    return directory
+
+def test_builds_csv_and_parquet(tmp_path, vendor_dir):
+    csv, parquet = tmp_path / "lcr.csv", tmp_path / "lcr.parquet"
+    assert main([str(vendor_dir), "-o", str(csv), "--lcr-n", "2", "--final-decimals", "3"]) == EXIT_OK
+    assert main([str(vendor_dir), "-o", str(parquet), "--lcr-n", "2"]) == EXIT_OK
+
+    table = pd.read_csv(csv, dtype=str, keep_default_na=False)
+    assert list(table.columns) == RESULT_COLUMNS
+    assert table[RESULT_COLUMNS[0]].tolist() == ["44", "447"]
+    assert table[RESULT_COLUMNS[7]].tolist() == ["0.150", "0.200"]
+    assert table[RESULT_COLUMNS[-1]].tolist() == ["v2", "v1"]
+    assert pq.read_table(parquet).column(RESULT_COLUMNS[7]).to_pylist() == [0.15, 0.2]
+
+def test_reports_failures_with_exit_codes(tmp_path, vendor_dir, capsys):
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    assert main([str(empty), "-o", str(tmp_path / "out.csv")]) == EXIT_NO_INPUT
+
+    corrupt = tmp_path / "corrupt.zip"
+    corrupt.write_bytes(b"PK\x03\x04 not really a zip")
+    assert main([str(corrupt), "-o", str(tmp_path / "out.csv")]) == EXIT_FAILED
+    assert "Build failed" in capsys.readouterr().err
+
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(vendor_dir), "-o", str(tmp_path / "out.csv"), "--lcr-n", "0"])
+    assert exit_info.value.code == EXIT_USAGE
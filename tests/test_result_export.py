@@ -0,0 +1,35 @@
+import pandas as pd
+import pyarrow.feather as pf
+import pyarrow.parquet as pq
+
+from rate_build import RESULT_COLUMNS, RATE_COLUMNS
+import result_export
+from result_export import write_columnar
+
+def result_table(rows=10):
+    table = pd.DataFrame({name: [f"{name[:3]}{row % (row // 3 + 1)}" for row in range(rows)] for name in RESULT_COLUMNS})
+    table[RATE_COLUMNS] = [[row / 7] * len(RATE_COLUMNS) for row in range(rows)]
+    table.loc[4, RESULT_COLUMNS[1]] = None
+    return table
+
+def test_columnar_batches_add_labels(tmp_path):
+    table = result_table()
+    write_columnar(table, tmp_path / "t.arrow", "arrow", 3, chunk_rows=3)
+    write_columnar(table, tmp_path / "t.parquet", "parquet", 3, chunk_rows=3)
+    arrow = pf.read_table(tmp_path / "t.arrow").to_pandas()
+    parquet = pq.read_table(tmp_path / "t.parquet").to_pandas()
+    assert arrow.equals(parquet)
+    assert isinstance(arrow[RESULT_COLUMNS[1]].dtype, pd.CategoricalDtype)
+    descriptions = arrow[RESULT_COLUMNS[1]].astype(object)
+    assert descriptions.isna().tolist() == table[RESULT_COLUMNS[1]].isna().tolist()
+    assert descriptions.dropna().tolist() == table[RESULT_COLUMNS[1]].dropna().tolist()
+    assert (arrow[RATE_COLUMNS].to_numpy() == table[RATE_COLUMNS].round(3).to_numpy()).all()
+
+def test_large_exports_need_nginx(tmp_path, monkeypatch):
+    path = tmp_path / "t.csv"
+    path.write_bytes(b"x" * 11)
+    monkeypatch.setattr(result_export, "STATIC_FILE_LIMIT", 10)
+    monkeypatch.setattr(result_export, "EXPORT_SECRET", "")
+    assert result_export.export_too_large(path)
+    monkeypatch.setattr(result_export, "EXPORT_SECRET", "secret")
+    assert not result_export.export_too_large(path)
@@ -0,0 +1,14 @@
+import numpy as np
+
+from rate_build import build_rate_deck, deck_lcr_table
+from what_if import WhatIfDeck
+from conftest import random_vendor_files
+
+def test_toggles_match_rebuild():
+    what_if = WhatIfDeck(build_rate_deck(random_vendor_files(count=5, prefixes=500))[0], 4)
+    rng = np.random.default_rng(3)
+    for _ in range(12):
+        enabled = set(rng.choice(what_if.vendors, rng.integers(1, len(what_if.vendors) + 1), replace=False).tolist())
+        what_if.set_enabled(enabled)
+        files = [(f, name) for f, name in random_vendor_files(count=5, prefixes=500) if name[:-len(".csv")] in enabled]
+        assert what_if.table().equals(deck_lcr_table(build_rate_deck(files)[0], 4))
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from rate_ingest import RATE_TYPES
+from lcr_engine import rank_rates, ranked_lcr_rates, average_rates, mean_rates, holder_sources
+
+# --- What-if Deck ---
+
+class WhatIfDeck:
+    """LCR table of a complete deck that follows vendors being switched off and on.
+
+    Vendors are the deck's source_vendors, so files sharing a Vendor name
+    switch together. Every rate type keeps its rates ranked per prefix
+    (rank_rates), per-prefix sums and counts, and the quotes of every vendor.
+    Switching a vendor only revisits the prefixes it quotes. Counts move by
+    that vendor's quotes. Sums are added up again from the prefixes' quotes in
+    upload order, with switched-off ones as 0.0, so averages equal a rebuild's
+    exactly instead of drifting with every toggle. The LCR-N rate is re-picked, from the first
+    n + (switched-off quotes) ranked rates, only where one of the vendor's
+    quotes falls inside that window or fewer than n rates are left.
+    """
+
+    def __init__(self, deck, lcr_n, ranks=None):
+        self.deck = deck
+        self.lcr_n = lcr_n
+        self.vendors, source_vendor_ids = np.unique(deck.source_vendors.astype(str), return_inverse=True)
+        source_vendor_ids = source_vendor_ids.astype(np.int16 if len(self.vendors) < 2 ** 15 else np.int32)
+        self._enabled = np.ones(len(self.vendors), dtype=bool)
+        self._state = {}
+
+        for rate_type in RATE_TYPES:
+            offsets, ranked, order = ranks[rate_type] if ranks is not None else rank_rates(deck, rate_type)
+            rates, group_ids = deck.rates(rate_type), deck.group_ids(rate_type)
+            quote_vendors = source_vendor_ids[deck.source_ids(rate_type)]
+
+            valid = np.flatnonzero(rates >= 0.0)
+            by_vendor = valid[np.argsort(quote_vendors[valid], kind="stable")]
+            vendor_offsets = np.zeros(len(self.vendors) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(quote_vendors[valid], minlength=len(self.vendors)), out=vendor_offsets[1:])
+
+            valid_ids = group_ids[valid]
+            quote_ranks = np.zeros(len(rates), dtype=np.int32)
+            quote_ranks[order] = np.arange(len(order)) - np.repeat(offsets[:-1], np.diff(offsets))
+            lcr, holders = ranked_lcr_rates((offsets, ranked, order), lcr_n)
+            self._state[rate_type] = {
+                "offsets": offsets,
+                "ranked": ranked,
+                "order": order,
+                "group_ids": group_ids,
+                "kept_rates": np.where(rates >= 0.0, rates, 0.0),
+                "ranked_vendors": quote_vendors[order],
+                "quote_ranks": quote_ranks,
+                "vendor_quotes": by_vendor,
+                "vendor_offsets": vendor_offsets,
+                "sums": np.bincount(valid_ids, weights=rates[valid], minlength=len(deck)),
+                "counts": np.bincount(valid_ids, minlength=len(deck)),
+                "disabled": np.zeros(len(deck), dtype=np.int64),
+                "averages": average_rates(group_ids, rates, len(deck)),
+                "lcr": lcr,
+                "holders": holders,
+            }
+
+    @property
+    def enabled_vendors(self):
+        return [str(vendor) for vendor in self.vendors[self._enabled]]
+
+    def set_enabled(self, vendors):
+        """Switches on exactly the given vendors. Returns the number of prefixes revisited."""
+        wanted = np.isin(self.vendors, list(vendors))
+        changed = np.flatnonzero(wanted != self._enabled)
+        return sum(self.set_vendor(self.vendors[vendor_id], bool(wanted[vendor_id])) for vendor_id in changed)
+
+    def set_vendor(self, vendor, enabled):
+        """Switches one vendor off or on. Returns the number of prefixes revisited."""
+        vendor_id = int(np.searchsorted(self.vendors, vendor))
+        if vendor_id == len(self.vendors) or self.vendors[vendor_id] != vendor:
+            raise KeyError(vendor)
+        if self._enabled[vendor_id] == enabled:
+            return 0
+        self._enabled[vendor_id] = enabled
+
+        sign = 1 if enabled else -1
+        touched = np.zeros(len(self.deck), dtype=bool)
+        for rate_type in RATE_TYPES:
+            state = self._state[rate_type]
+            start, end = state["vendor_offsets"][vendor_id:vendor_id + 2]
+            quotes = state["vendor_quotes"][start:end]
+            group_ids = state["group_ids"][quotes]
+
+            # Decided with the vendor switched off, when the window is widest and fewest rates are left
+            if enabled:
+                reselect = self._in_window(state, quotes, group_ids)
+            self._move_counts(state, group_ids, sign)
+            state["kept_rates"][quotes] = self.deck.rates(rate_type)[quotes] if enabled else 0.0
+            if not enabled:
+                reselect = self._in_window(state, quotes, group_ids)
+
+            prefixes = _distinct(group_ids, len(self.deck))
+            self._resum(state, rate_type, prefixes)
+            state["averages"][prefixes] = mean_rates(state["sums"][prefixes], state["counts"][prefixes])
+            self._reselect(state, _distinct(group_ids[reselect], len(self.deck)))
+            touched[prefixes] = True
+        return int(touched.sum())
+
+    @staticmethod
+    def _move_counts(state, group_ids, sign):
+        np.add.at(state["counts"], group_ids, sign)
+        np.add.at(state["disabled"], group_ids, -sign)
+
+    def _resum(self, state, rate_type, prefixes):
+        """Adds up the kept rates of some prefixes again in upload order, as average_rates does.
+
+        Adding the 0.0 of a switched-off or negative quote leaves a sum
+        unchanged, so one bincount pass gives exactly a rebuild's sums: over
+        the whole deck when the prefixes hold most quotes, else over theirs.
+        """
+        offsets, kept_rates = self.deck.offsets(rate_type), state["kept_rates"]
+        starts = offsets[prefixes]
+        lengths = offsets[prefixes + 1] - starts
+        if 2 * lengths.sum() > len(kept_rates):
+            sums = np.bincount(state["group_ids"], weights=kept_rates, minlength=len(self.deck))[prefixes]
+        else:
+            quotes = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            local = np.repeat(np.arange(len(prefixes)), lengths)
+            sums = np.bincount(local, weights=kept_rates[quotes], minlength=len(prefixes))
+        state["sums"][prefixes] = sums
+
+    def _in_window(self, state, quotes, group_ids):
+        """Flags quotes that can decide their prefix's LCR-N rate."""
+        window = self.lcr_n + state["disabled"][group_ids]
+        return (state["quote_ranks"][quotes] < window) | (state["counts"][group_ids] < self.lcr_n)
+
+    def _reselect(self, state, prefixes):
+        """Re-picks the LCR-N rate of some prefixes among the quotes of switched-on vendors."""
+        offsets, n = state["offsets"], self.lcr_n
+        starts = offsets[prefixes]
+        lengths = np.minimum(offsets[prefixes + 1] - starts, n + state["disabled"][prefixes])
+        local = np.repeat(np.arange(len(prefixes)), lengths)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+        kept = np.flatnonzero(self._enabled[state["ranked_vendors"][positions]])
+        kept_local = local[kept]
+        counts = np.bincount(kept_local, minlength=len(prefixes))
+        occupied = counts > 0
+        picks = kept[(np.searchsorted(kept_local, np.arange(len(prefixes))) + np.minimum(counts, n) - 1)[occupied]]
+
+        state["lcr"][prefixes] = 0.0
+        state["holders"][prefixes] = -1
+        state["lcr"][prefixes[occupied]] = state["ranked"][positions[picks]]
+        state["holders"][prefixes[occupied]] = state["order"][positions[picks]]
+
+    def table(self):
+        """Returns the current LCR table, laid out like lcr_engine.lcr_table."""
+        table = {"prefix": self.deck.prefixes}
+        for key in ("description", "currency", "billing_scheme"):
+            table[key] = self.deck.metadata(key)
+        for rate_type in RATE_TYPES:
+            state = self._state[rate_type]
+            table[f"average_{rate_type}"] = state["averages"].copy()
+            table[f"lcr_{rate_type}"] = state["lcr"].copy()
+            table[f"source_{rate_type}"] = holder_sources(self.deck, rate_type, state["holders"])
+        return pd.DataFrame(table)
+
+def _distinct(ids, size):
+    """Returns the distinct ids, ascending, via a mask rather than a sort."""
+    seen = np.zeros(size, dtype=bool)
+    seen[ids] = True
+    return np.flatnonzero(seen)